@@ -1,65 +1,86 @@
-import os
-import json
-from collections import defaultdict
-
-def merge_and_deduplicate_files(input_dir, output_file):
-    """
-    Merge all JSON files in input_dir into a single JSON file,
-    removing duplicate posts (based on 'id') and their comments.
-    """
-    # Dictionary to store posts by their ID for deduplication
-    posts_by_id = {}
-    
-    # Counters for statistics
-    total_files = 0
-    total_posts = 0
-    duplicate_posts = 0
-    
-    # Walk through the input directory
-    for root, _, files in os.walk(input_dir):
-        for filename in files:
-            if filename.endswith('.txt'):
-                filepath = os.path.join(root, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        total_files += 1
-                        
-                        for post in data:
-                            post_id = post['id']
-                            total_posts += 1
-                            
-                            # If we haven't seen this post before, add it
-                            if post_id not in posts_by_id:
-                                posts_by_id[post_id] = post
-                            else:
-                                duplicate_posts += 1
-                                
-                except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                    print(f"Error reading {filepath}: {e}")
-                except Exception as e:
-                    print(f"Unexpected error processing {filepath}: {e}")
-    
-    # Convert the dictionary values to a list for the final output
-    merged_posts = list(posts_by_id.values())
-    
-    # Save the merged and deduplicated data
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(merged_posts, f, indent=2, ensure_ascii=False)
-    
-    # Print statistics
-    print(f"Processed {total_files} files with {total_posts} total posts")
-    print(f"Found {duplicate_posts} duplicate posts")
-    print(f"Saved {len(merged_posts)} unique posts to {output_file}")
-
-if __name__ == '__main__':
-    input_directory = './search-results'
-    output_filename = './archive.json'
-    
-    if not os.path.exists(input_directory):
-        print(f"Error: Input directory '{input_directory}' does not exist")
-        exit(1)
-    
-    print(f"Merging files from '{input_directory}'...")
-    merge_and_deduplicate_files(input_directory, output_filename)
+import os
+import json
+from collections import defaultdict
+import time
+from manifest import write_manifest, is_subreddit_dir
+from atomic_write import temp_path
+from metrics import metrics, configure
+
+def merge_and_deduplicate_files(input_dir, output_file):
+    """
+    Merge all JSON files in input_dir into a single JSON file,
+    removing duplicate posts (based on 'id') and their comments.
+    """
+    # Dictionary to store posts by their ID for deduplication
+    posts_by_id = {}
+    
+    # Counters for statistics
+    total_files = 0
+    total_posts = 0
+    duplicate_posts = 0
+    
+    # Walk through the input directory
+    for root, _, files in os.walk(input_dir):
+        for filename in files:
+            if filename.endswith('.txt'):
+                filepath = os.path.join(root, filename)
+                file_start = time.perf_counter()
+                try:
+                    with open(filepath, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                        total_files += 1
+                        metrics.inc('merge_files_total')
+                        metrics.inc('merge_bytes_total', f.tell())
+                        
+                        for post in data:
+                            post_id = post['id']
+                            total_posts += 1
+                            
+                            # If we haven't seen this post before, add it
+                            if post_id not in posts_by_id:
+                                posts_by_id[post_id] = post
+                            else:
+                                duplicate_posts += 1
+                        metrics.inc('merge_posts_total', len(data))
+                    metrics.observe('merge_file_seconds', time.perf_counter() - file_start)
+                                
+                except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                    metrics.inc('merge_file_errors_total')
+                    print(f"Error reading {filepath}: {e}")
+                except Exception as e:
+                    print(f"Unexpected error processing {filepath}: {e}")
+    
+    # Convert the dictionary values to a list for the final output
+    merged_posts = list(posts_by_id.values())
+    metrics.set('merge_unique_posts', len(merged_posts))
+    metrics.set('merge_duplicate_posts', duplicate_posts)
+    
+    # Save the merged and deduplicated data. Written next to the output and swapped in,
+    # so a running viewer that has the old archive mapped never sees a half-written file
+    with metrics.timer('merge_write_seconds'):
+        tmp_path = temp_path(output_file)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(merged_posts, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, output_file)
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    if is_subreddit_dir(output_dir):
+        write_manifest(output_dir, media=False)
+    
+    # Print statistics
+    print(f"Processed {total_files} files with {total_posts} total posts")
+    print(f"Found {duplicate_posts} duplicate posts")
+    print(f"Saved {len(merged_posts)} unique posts to {output_file}")
+
+if __name__ == '__main__':
+    input_directory = './search-results'
+    output_filename = './archive.json'
+    
+    if not os.path.exists(input_directory):
+        print(f"Error: Input directory '{input_directory}' does not exist")
+        exit(1)
+    
+    print(f"Merging files from '{input_directory}'...")
+    configure('merge-posts')
+    merge_and_deduplicate_files(input_directory, output_filename)
+    metrics.close()
     print("Done!")
\ No newline at end of file
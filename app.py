@@ -1,143 +1,547 @@
-from flask import Flask, render_template, json, send_from_directory, redirect, url_for
-import os
-from urllib.parse import unquote
-
-app = Flask(__name__)
-
-# Configuration
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ARCHIVES_DIR = os.path.join(BASE_DIR, 'r')
-
-@app.route('/')
-def index():
-    subreddits = get_available_subreddits()
-    if subreddits:
-        return redirect(url_for('show_subreddit', subreddit=subreddits[0]))
-    return "No subreddits archived yet. Use the download script first."
-
-@app.route('/r/')
-def list_subreddits():
-    subreddits = get_available_subreddits()
-    subreddit_data = []
-    for subreddit in subreddits:
-        post_count = len(load_posts(subreddit))
-        subreddit_data.append({
-            'name': subreddit,
-            'post_count': post_count
-        })
-    return render_template('subreddits.html', subreddits=subreddit_data)
-
-@app.route('/r/<subreddit>')
-def show_subreddit(subreddit):
-    if not os.path.exists(os.path.join(ARCHIVES_DIR, subreddit)):
-        return "Subreddit not found", 404
-
-    posts = load_posts(subreddit)
-    subreddits = get_available_subreddits()
-    
-    # Check for icon in multiple formats
-    icon_path = None
-    icon_formats = ['icon.png', 'icon.jpg', 'icon.jpeg', 'icon.gif', 'icon.webp']
-    for fmt in icon_formats:
-        test_path = os.path.join(ARCHIVES_DIR, subreddit, 'images', fmt)
-        if os.path.exists(test_path):
-            icon_path = test_path
-            break
-    
-    # Check for banner in multiple formats
-    banner_path = None
-    banner_formats = ['banner.png', 'banner.jpg', 'banner.jpeg', 'banner.gif', 'banner.webp']
-    for fmt in banner_formats:
-        test_path = os.path.join(ARCHIVES_DIR, subreddit, 'images', fmt)
-        if os.path.exists(test_path):
-            banner_path = test_path
-            break
-
-    icon_url = f"/r/{subreddit}/images/{os.path.basename(icon_path)}" if icon_path else None
-    banner_url = f"/r/{subreddit}/images/{os.path.basename(banner_path)}" if banner_path else None
-
-    return render_template('archive.html',
-                         posts=posts,
-                         subreddit=subreddit,
-                         subreddits=subreddits,
-                         icon_url=icon_url,
-                         banner_url=banner_url)
-
-@app.route('/r/<subreddit>/images/<path:filename>')
-def serve_image(subreddit, filename):
-    return send_from_directory(
-        os.path.join(ARCHIVES_DIR, subreddit, 'images'),
-        unquote(filename)
-    )
-
-@app.route('/r/<subreddit>/post/<int:post_id>')
-def show_post(subreddit, post_id):
-    posts = load_posts(subreddit)
-    if 0 <= post_id < len(posts):
-        return render_template('archive.html',
-                            posts=[posts[post_id]],
-                            subreddit=subreddit,
-                            subreddits=get_available_subreddits())
-    else:
-        return "Post not found", 404
-
-@app.route('/r/<subreddit>/videos/<path:filename>')
-def serve_video(subreddit, filename):
-    return send_from_directory(
-        os.path.join(ARCHIVES_DIR, subreddit, 'videos'),
-        unquote(filename)
-    )
-
-# API endpoints
-@app.route('/api/subreddits')
-def list_subreddits_api():
-    subreddits = get_available_subreddits()
-    subreddit_data = []
-    for subreddit in subreddits:
-        post_count = len(load_posts(subreddit))
-        subreddit_data.append({
-            'name': subreddit,
-            'post_count': post_count
-        })
-    return json.jsonify(subreddit_data)
-
-@app.route('/api/r/<subreddit>/posts')
-def get_posts_api(subreddit):
-    return json.jsonify(load_posts(subreddit))
-
-def load_posts(subreddit):
-    archive_path = os.path.join(ARCHIVES_DIR, subreddit, 'archive.json')
-    try:
-        with open(archive_path, 'r') as f:
-            posts = json.load(f)
-            # Convert paths to web-accessible URLs
-            for post in posts:
-                if 'local_media' in post:
-                    if isinstance(post['local_media'], str):
-                        if post['local_media'].endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-                            post['local_media'] = f"/r/{subreddit}/images/{os.path.basename(post['local_media'])}"
-                        elif post['local_media'].endswith(('.mp4', '.webm')):
-                            post['local_media'] = f"/r/{subreddit}/videos/{os.path.basename(post['local_media'])}"
-                    elif isinstance(post['local_media'], list):
-                        post['local_media'] = [
-                            f"/r/{subreddit}/images/{os.path.basename(media)}" if media.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')) else
-                            f"/r/{subreddit}/videos/{os.path.basename(media)}"
-                            for media in post['local_media']
-                        ]
-            return posts
-    except FileNotFoundError:
-        return []
-
-def get_available_subreddits():
-    try:
-        return sorted([
-            d for d in os.listdir(ARCHIVES_DIR)
-            if os.path.isdir(os.path.join(ARCHIVES_DIR, d))
-        ])
-    except FileNotFoundError:
-        return []
-
-if __name__ == '__main__':
-    os.makedirs(ARCHIVES_DIR, exist_ok=True)
-    print("Visit http://127.0.0.1:5000/r/ to view all subreddits")
-    app.run(debug=True)
+from flask import Flask, render_template, json, send_from_directory, send_file, redirect, url_for, request, abort, stream_with_context, g
+from werkzeug.security import safe_join
+import os
+import gzip
+import zlib
+import hashlib
+import time
+import functools
+from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote
+from storage import open_store, store_stamp
+from search_index import refresh_search_index
+from manifest import load_manifest, source_stamp
+from thumbnails import ThumbnailCache, THUMBNAIL_WIDTHS, is_resizable
+from feed_index import SORT_KEYS, FILTERS
+from metrics import metrics, configure
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+app = Flask(__name__)
+
+# Configuration
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVES_DIR = os.path.join(BASE_DIR, 'r')
+# Subreddits to list, e.g. only those in a static export; None lists every folder
+LISTED_SUBREDDITS = None
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+thumbnail_cache = ThumbnailCache()
+
+# Archived media never changes once downloaded
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/json', 'application/x-ndjson'}
+COMPRESS_MIN_BYTES = 1024
+# Streamed JSON is sent in pieces of roughly this size
+STREAM_CHUNK_BYTES = 64 * 1024
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Part of every ETag so pages are revalidated after the app or templates change
+BUILD_STAMP = [os.stat(os.path.join(BASE_DIR, 'app.py')).st_mtime_ns] + sorted(
+    os.stat(entry.path).st_mtime_ns for entry in os.scandir(os.path.join(BASE_DIR, 'templates'))
+)
+
+def archive_etag(subreddit=None, variant=None):
+    """ETag for pages built from one subreddit's archive, or from all of them if subreddit is None.
+
+    variant tells apart responses negotiated from the same URL, e.g. JSON and NDJSON.
+    """
+    subreddits = get_available_subreddits()
+    names = subreddits if subreddit is None else [subreddit]
+    stamps = [source_stamp(os.path.join(ARCHIVES_DIR, name)) for name in names]
+    return hashlib.sha1(json.dumps([BUILD_STAMP, subreddits, stamps, variant]).encode()).hexdigest()
+
+def etag_cached(view):
+    """Answer with 304 Not Modified while the archive behind the page is unchanged.
+
+    A subreddit that doesn't exist is never answered from the cache, and a
+    response whose view sets g.uncacheable gets no ETag.
+    """
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        subreddit = kwargs.get('subreddit')
+        if subreddit is not None and subreddit not in get_available_subreddits():
+            return view(**kwargs)
+        # The API answers the same URL as JSON or NDJSON depending on Accept (see stream_json)
+        etag = archive_etag(subreddit, NDJSON_MIMETYPE if wants_ndjson() else None)
+        # Compressed variants carry a suffix (see compress_response)
+        matched = next((tag for tag in (etag, f"{etag}-gzip", f"{etag}-br") if tag in request.if_none_match), None)
+        metrics.inc('etag_requests_total', result='hit' if matched else 'miss')
+        if matched:
+            response = app.response_class(status=304)
+            response.set_etag(matched)
+        else:
+            response = app.make_response(view(**kwargs))
+            if response.status_code != 200 or g.get('uncacheable'):
+                return response
+            response.set_etag(etag)
+        response.cache_control.no_cache = True
+        response.vary.add('Accept')
+        response.vary.add('Accept-Encoding')
+        return response
+    return wrapper
+
+def immutable(response):
+    response.cache_control.no_cache = None
+    response.cache_control.max_age = MEDIA_MAX_AGE
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def wants_ndjson():
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def stream_json(envelope, key, items):
+    """Stream items as NDJSON, or as the list under key inside the envelope object.
+
+    The client picks the format with its Accept header. NDJSON responses carry
+    the envelope fields as X- headers instead. envelope=None streams a bare list.
+    """
+    ndjson = wants_ndjson()
+
+    def generate():
+        buffer = []
+        size = 0
+        if not ndjson:
+            if envelope is None:
+                buffer.append('[')
+            else:
+                buffer.append('{' + ''.join(f"{json.dumps(k)}: {json.dumps(v)}, " for k, v in envelope.items()) + f"{json.dumps(key)}: [")
+        for i, item in enumerate(items):
+            if isinstance(item, bytes):
+                # Undecoded post from the archive; JSON strings can't hold raw line breaks
+                encoded = item.decode('utf-8').replace('\r', '').replace('\n', '')
+            else:
+                encoded = json.dumps(item)
+            if ndjson:
+                encoded += '\n'
+            elif i:
+                encoded = ',' + encoded
+            buffer.append(encoded)
+            size += len(encoded)
+            if size >= STREAM_CHUNK_BYTES:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if not ndjson:
+            buffer.append(']' if envelope is None else ']}')
+        yield ''.join(buffer)
+
+    response = app.response_class(stream_with_context(generate()),
+                                  mimetype=NDJSON_MIMETYPE if ndjson else 'application/json')
+    response.vary.add('Accept')
+    if ndjson and envelope is not None:
+        for k, v in envelope.items():
+            response.headers['X-' + k.replace('_', '-').title()] = '' if v is None else str(v)
+    return response
+
+def compress_stream(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip container
+        compress, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    try:
+        for chunk in chunks:
+            # Flush every chunk so the client can start parsing before the stream ends
+            yield compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk) + flush()
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+# Registered before compress_response so it runs after it and times the compression too.
+# Streamed bodies are timed up to their first byte.
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or 'not_found'
+    metrics.inc('http_requests_total', endpoint=endpoint, status=response.status_code)
+    if 'request_start' in g:
+        metrics.observe('http_request_seconds', time.perf_counter() - g.request_start, endpoint=endpoint)
+    return response
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoding = 'br'
+    elif accepted['gzip']:
+        encoding = 'gzip'
+    else:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=5))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+@app.route('/')
+def index():
+    subreddits = get_available_subreddits()
+    if subreddits:
+        return redirect(url_for('show_subreddit', subreddit=subreddits[0]))
+    return "No subreddits archived yet. Use the download script first."
+
+@app.route('/r/')
+@etag_cached
+def list_subreddits():
+    return render_template('subreddits.html', subreddits=get_subreddit_summaries())
+
+@app.route('/r/<subreddit>')
+@etag_cached
+def show_subreddit(subreddit):
+    if not os.path.exists(os.path.join(ARCHIVES_DIR, subreddit)):
+        return "Subreddit not found", 404
+
+    offset, limit = get_page_args()
+    query = request.args.get('q', '').strip()
+    feed = get_feed_args()
+    store = get_store(subreddit)
+    post_count = store.count() if store else 0
+    if query:
+        posts, match_count = search_posts(subreddit, store, query, offset, limit)
+    else:
+        posts, match_count = load_page(subreddit, store, offset, limit, feed)
+    posts = list(posts)
+    next_offset = offset + limit if offset + limit < match_count else None
+
+    # Infinite scroll asks for the next batch of post cards only
+    if request.args.get('fragment'):
+        response = app.make_response(render_template('post_cards.html',
+                                                     posts=posts,
+                                                     subreddit=subreddit))
+        response.headers['X-Next-Offset'] = '' if next_offset is None else str(next_offset)
+        return response
+
+    subreddits = get_available_subreddits()
+    
+    # Icon and banner filenames and the date range are recorded in the manifest
+    manifest = load_manifest(os.path.join(ARCHIVES_DIR, subreddit))
+    media = manifest['media']
+    icon_url = f"/r/{subreddit}/images/{media['icon']}" if media['icon'] else None
+    banner_url = f"/r/{subreddit}/images/{media['banner']}" if media['banner'] else None
+
+    return render_template('archive.html',
+                         posts=posts,
+                         page_size=limit,
+                         next_offset=next_offset,
+                         post_count=post_count,
+                         total_score=store.total_score() if store else 0,
+                         query=query,
+                         feed=feed,
+                         match_count=match_count,
+                         subreddit=subreddit,
+                         subreddits=subreddits,
+                         icon_url=icon_url,
+                         banner_url=banner_url,
+                         years=archive_years(manifest['posts']))
+
+@app.route('/r/<subreddit>/images/<path:filename>')
+def serve_image(subreddit, filename):
+    return immutable(send_from_directory(
+        os.path.join(ARCHIVES_DIR, subreddit, 'images'),
+        unquote(filename)
+    ))
+
+@app.route('/r/<subreddit>/thumbs/<int:width>/<path:filename>')
+def serve_thumbnail(subreddit, width, filename):
+    filename = unquote(filename)
+    source_path = safe_join(ARCHIVES_DIR, subreddit, 'images', filename)
+    if width not in THUMBNAIL_WIDTHS or source_path is None or not os.path.isfile(source_path):
+        abort(404)
+    if not is_resizable(filename):
+        return redirect(url_for('serve_image', subreddit=subreddit, filename=filename))
+    try:
+        return immutable(send_file(thumbnail_cache.get(subreddit, width, source_path), mimetype='image/webp'))
+    except OSError as e:
+        # Unreadable or truncated image: fall back to the original
+        print(f"Error generating thumbnail for {source_path}: {e}")
+        return redirect(url_for('serve_image', subreddit=subreddit, filename=filename))
+
+@app.template_global()
+def thumbnail_srcset(media_url):
+    """srcset for an /r/<subreddit>/images/<file> URL, or '' if it can't be resized."""
+    prefix, sep, filename = media_url.partition('/images/')
+    # Static exports have no thumbnail route and use the originals
+    if not sep or not is_resizable(filename) or app.config.get('STATIC_EXPORT'):
+        return ''
+    return ', '.join(f"{prefix}/thumbs/{width}/{filename} {width}w" for width in THUMBNAIL_WIDTHS)
+
+@app.route('/r/<subreddit>/post/<int:post_id>')
+def show_post_by_position(subreddit, post_id):
+    # Old list-position links. Temporary redirect: positions shift when the
+    # archive is re-merged, so browsers must not cache where one points
+    store = get_store(subreddit)
+    post = store.get_at(post_id) if store else None
+    if post is None or not post.get('id'):
+        return "Post not found", 404
+    return redirect(url_for('show_post', subreddit=subreddit, post_id=post['id']), code=302)
+
+@app.route('/r/<subreddit>/comments/<post_id>')
+@etag_cached
+def show_post(subreddit, post_id):
+    store = get_store(subreddit)
+    post = store.get(post_id) if store else None
+    if post is None:
+        return "Post not found", 404
+    post = localize_media(subreddit, post)
+    return render_template('archive.html',
+                        posts=[post],
+                        post_data=post,
+                        page_size=1,
+                        next_offset=None,
+                        post_count=store.count(),
+                        total_score=store.total_score(),
+                        subreddit=subreddit,
+                        subreddits=get_available_subreddits())
+
+@app.route('/r/<subreddit>/videos/<path:filename>')
+def serve_video(subreddit, filename):
+    # send_from_directory answers Range requests with 206, so seeking doesn't restart the download
+    return immutable(send_from_directory(
+        os.path.join(ARCHIVES_DIR, subreddit, 'videos'),
+        unquote(filename)
+    ))
+
+# API endpoints
+@app.route('/metrics')
+def show_metrics():
+    # Only for scrapers on the same machine
+    if request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(404)
+    metrics.set('thumbnail_cache_hits', thumbnail_cache.hits)
+    metrics.set('thumbnail_cache_misses', thumbnail_cache.misses)
+    return app.response_class(metrics.prometheus(), mimetype='text/plain')
+
+@app.route('/api/subreddits')
+@etag_cached
+def list_subreddits_api():
+    return json.jsonify(get_subreddit_summaries())
+
+@app.route('/api/r/<subreddit>/posts')
+@etag_cached
+def get_all_posts_api(subreddit):
+    # The original API: a bare list of every post. Paged clients use /api/v2
+    store = get_store(subreddit)
+    posts, _ = load_page(subreddit, store, 0, None, get_feed_args(), raw=True)
+    return stream_json(None, None, posts)
+
+@app.route('/api/v2/r/<subreddit>/posts')
+@etag_cached
+def get_posts_api(subreddit):
+    # limit=all streams the rest of the (sorted and filtered) feed from offset onwards
+    offset, limit = get_page_args(allow_all=True)
+    feed = get_feed_args()
+    store = get_store(subreddit)
+    posts, total = load_page(subreddit, store, offset, limit, feed, raw=True)
+    stop = total if limit is None else min(offset + limit, total)
+    return stream_json({
+        'offset': offset,
+        'limit': limit,
+        'sort': feed['sort'],
+        'total': total,
+        'total_score': store.total_score() if store else 0,
+        'next_offset': stop if stop < total else None
+    }, 'posts', posts)
+
+@app.route('/api/r/<subreddit>/post/<post_id>')
+@etag_cached
+def get_post_api(subreddit, post_id):
+    store = get_store(subreddit)
+    post = store.get(post_id) if store else None
+    if post is None:
+        return json.jsonify({'error': 'Post not found'}), 404
+    return json.jsonify(localize_media(subreddit, post))
+
+@app.route('/api/r/<subreddit>/search')
+@etag_cached
+def search_api(subreddit):
+    query = request.args.get('q', '').strip()
+    offset, limit = get_page_args(offset_param='cursor')
+    store = get_store(subreddit)
+    posts, total = search_posts(subreddit, store, query, offset, limit)
+    return stream_json({
+        'query': query,
+        'total': total,
+        'next_cursor': str(offset + limit) if offset + limit < total else None
+    }, 'results', posts)
+
+def get_page_args(offset_param='offset', allow_all=False):
+    offset = max(request.args.get(offset_param, 0, type=int), 0)
+    if allow_all and request.args.get('limit') == 'all':
+        return offset, None
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    return offset, min(max(limit, 1), MAX_PAGE_SIZE)
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+def get_feed_args():
+    """Sort, filters and date range of the feed from the query string.
+
+    sort is one of SORT_KEYS, each of FILTERS can be 1 (only) or 0 (exclude),
+    year=2023 limits to one year and since/until (YYYY-MM-DD, inclusive) to a range.
+    """
+    sort = request.args.get('sort')
+    filters = {name: request.args[name] == '1' for name in FILTERS if request.args.get(name) in ('0', '1')}
+    since = until = None
+    year = request.args.get('year', type=int)
+    if year and 1970 <= year <= 9998:
+        since = datetime(year, 1, 1, tzinfo=timezone.utc)
+        until = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+    since = parse_date(request.args.get('since')) or since
+    until_day = parse_date(request.args.get('until'))
+    if until_day:
+        until = until_day + timedelta(days=1)
+    return {
+        'sort': sort if sort in SORT_KEYS else None,
+        'filters': filters,
+        'since': since.timestamp() if since else None,
+        'until': until.timestamp() if until else None
+    }
+
+@app.template_global()
+def feed_url(**changes):
+    """URL of the current feed with some query parameters changed (None removes one)."""
+    args = {key: value for key, value in request.args.items() if key not in ('offset', 'limit', 'fragment')}
+    args.update(changes)
+    return url_for(request.endpoint, **request.view_args,
+                   **{key: value for key, value in args.items() if value is not None})
+
+def archive_years(posts_summary):
+    first, last = posts_summary['first_post_utc'], posts_summary['last_post_utc']
+    if not first or not last:
+        return []
+    return list(range(datetime.fromtimestamp(last, timezone.utc).year,
+                      datetime.fromtimestamp(first, timezone.utc).year - 1, -1))
+
+# One open store per subreddit for the life of the process. A store replaced
+# because its archive changed is left to the garbage collector rather than
+# closed, since a response may still be streaming from it.
+stores = {}
+
+def get_store(subreddit):
+    subreddit_dir = os.path.join(ARCHIVES_DIR, subreddit)
+    if not os.path.isdir(subreddit_dir):
+        return None
+    stamp = store_stamp(subreddit_dir)
+    cached = stores.get(subreddit)
+    if cached is None or cached[0] != stamp:
+        cached = stores[subreddit] = (stamp, open_store(subreddit_dir))
+    return cached[1]
+
+def load_page(subreddit, store, offset, limit, feed, raw=False):
+    """Return (posts, total) for a page of the feed; limit=None returns the rest of it.
+
+    raw=True passes posts the JSON store needn't decode through as JSON bytes (see localize_media).
+    """
+    if store is None:
+        return iter(()), 0
+    posts, total = store.query(offset=offset, limit=limit, raw=raw, **feed)
+    return (localize_media(subreddit, post) for post in posts), total
+
+def search_posts(subreddit, store, query, offset, limit):
+    if store is None or not query:
+        return [], 0
+    search_index, current = refresh_search_index(os.path.join(ARCHIVES_DIR, subreddit), store)
+    # Results from an index still catching up with the archive mustn't be cached under its ETag
+    g.uncacheable = not current
+    hits, total = search_index.search(query, offset, limit)
+    return iter_search_results(subreddit, store, hits), total
+
+def iter_search_results(subreddit, store, hits):
+    # Posts are fetched one at a time so a streamed response never holds the whole page
+    for hit in hits:
+        post = store.get(hit['id'])
+        if post is None:
+            continue
+        post = localize_media(subreddit, post)
+        post['highlight'] = {'title': hit['title'], 'snippet': hit['snippet']}
+        yield post
+
+def localize_media(subreddit, post):
+    if isinstance(post, bytes):
+        # Undecoded JSON: only posts with local media have anything to rewrite
+        if b'"local_media"' not in post:
+            return post
+        post = json.loads(post)
+    # Convert paths to web-accessible URLs
+    if 'local_media' in post:
+        if isinstance(post['local_media'], str):
+            if post['local_media'].endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
+                post['local_media'] = f"/r/{subreddit}/images/{os.path.basename(post['local_media'])}"
+            elif post['local_media'].endswith(('.mp4', '.webm')):
+                post['local_media'] = f"/r/{subreddit}/videos/{os.path.basename(post['local_media'])}"
+        elif isinstance(post['local_media'], list):
+            post['local_media'] = [
+                f"/r/{subreddit}/images/{os.path.basename(media)}" if media.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')) else
+                f"/r/{subreddit}/videos/{os.path.basename(media)}"
+                for media in post['local_media']
+            ]
+    return post
+
+def load_posts(subreddit):
+    store = get_store(subreddit)
+    if store is None:
+        return []
+    return [localize_media(subreddit, post) for post in store.iter_posts()]
+
+def get_subreddit_summaries():
+    subreddit_data = []
+    for subreddit in get_available_subreddits():
+        manifest = load_manifest(os.path.join(ARCHIVES_DIR, subreddit))
+        posts, media = manifest['posts'], manifest['media']
+        subreddit_data.append({
+            'name': subreddit,
+            'post_count': posts['post_count'],
+            'comment_count': posts['comment_count'],
+            'total_score': posts['total_score'],
+            'first_post_utc': posts['first_post_utc'],
+            'last_post_utc': posts['last_post_utc'],
+            'media_bytes': media['media_bytes'],
+            'icon_url': f"/r/{subreddit}/images/{media['icon']}" if media['icon'] else None
+        })
+    return subreddit_data
+
+def get_available_subreddits():
+    try:
+        return sorted([
+            d for d in os.listdir(ARCHIVES_DIR)
+            if os.path.isdir(os.path.join(ARCHIVES_DIR, d))
+            and (LISTED_SUBREDDITS is None or d in LISTED_SUBREDDITS)
+        ])
+    except FileNotFoundError:
+        return []
+
+if __name__ == '__main__':
+    os.makedirs(ARCHIVES_DIR, exist_ok=True)
+    print("Visit http://127.0.0.1:5000/r/ to view all subreddits")
+    configure('viewer', serve=False)
+    app.run(debug=True)
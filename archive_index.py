@@ -0,0 +1,381 @@
+import os
+import re
+import json
+import mmap
+import zlib
+import struct
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+
+from feed_index import FeedIndexWriter, load_feed_index
+from atomic_write import temp_path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# An archive.json is one big JSON array of posts. To show a single page of it we
+# would normally have to parse the whole file, so instead we scan it once and
+# record where every post starts and how long it is. The table lives next to the
+# archive and is rebuilt whenever archive.json changes. The same scan writes the
+# sort orders and filter bitmaps of feed_index.py.
+#
+# Readers map the archive and its index files read-only instead of loading them,
+# so any number of server processes share one copy in the OS page cache.
+INDEX_DIRNAME = '.index'
+OFFSETS_FILENAME = 'offsets.bin'
+IDS_FILENAME = 'ids.bin'
+# blake2b of every post's JSON, in list order, so search_index.py can tell which
+# posts changed without decoding the ones that didn't
+DIGESTS_FILENAME = 'digests.bin'
+DIGEST_SIZE = 16
+META_FILENAME = 'meta.json'
+# Held (flock) while the index is built, so server workers never build it at once
+LOCK_FILENAME = 'lock'
+INDEX_VERSION = 5
+
+# One entry per post: byte offset (u64) and byte length (u32) inside archive.json
+OFFSET_RECORD = struct.Struct('<QI')
+
+# Open-addressing hash table keyed by Reddit post id: zero-padded id, offset, length.
+# An all-zero id marks an empty slot. Lookups hash to a slot and probe linearly.
+ID_RECORD = struct.Struct('<16sQI')
+ID_PROBE_WINDOW = 8
+
+# Skips everything that is not a bracket, including whole strings, in one regex call
+_SKIP = re.compile(rb'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+# Mapped files by subreddit directory, kept while the archive is unchanged
+_mapped = {}
+
+
+def index_dir(subreddit_dir):
+    return os.path.join(subreddit_dir, INDEX_DIRNAME)
+
+
+class FileSlices:
+    """Slices of a file through ordinary reads, for where a mapped file can't be replaced."""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(self.size)
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return f.read(max(0, stop - start))
+
+
+def map_file(path):
+    """Map path read-only. Empty files can't be mapped and come back as b''."""
+    if os.name == 'nt':
+        # Windows refuses to replace a mapped file, which would block rebuilds and merges
+        return FileSlices(path)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def scan_records(buf):
+    """Yield (offset, length) for every object in the top-level JSON array in buf."""
+    pos = buf.find(b'[')
+    if pos < 0:
+        return
+    pos += 1
+    depth = 0
+    start = None
+    size = len(buf)
+
+    while True:
+        pos = _SKIP.match(buf, pos).end()
+        if pos >= size:
+            return
+        ch = buf[pos:pos + 1]
+        if ch in (b'{', b'['):
+            if depth == 0:
+                start = pos
+            depth += 1
+        elif depth == 0:
+            return  # closing bracket of the top-level array
+        else:
+            depth -= 1
+            if depth == 0:
+                yield start, pos + 1 - start
+        pos += 1
+
+
+def _id_hash(post_id):
+    return zlib.crc32(post_id)
+
+
+def write_id_table(path, entries):
+    """Write (post_id, offset, length) entries as a hash table at path."""
+    slot_count = 8
+    while slot_count < len(entries) * 2:
+        slot_count *= 2
+    mask = slot_count - 1
+
+    table = bytearray(slot_count * ID_RECORD.size)
+    for post_id, offset, length in entries:
+        slot = _id_hash(post_id) & mask
+        while True:
+            start = slot * ID_RECORD.size
+            existing = table[start:start + 16]
+            if not any(existing):
+                ID_RECORD.pack_into(table, start, post_id, offset, length)
+                break
+            if existing.rstrip(b'\0') == post_id:
+                break  # keep the first copy of a duplicated post
+            slot = (slot + 1) & mask
+
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(table)
+    os.replace(tmp_path, path)
+
+
+def _archive_stamp(archive_path):
+    st = os.stat(archive_path)
+    return {'archive_size': st.st_size, 'archive_mtime_ns': st.st_mtime_ns}
+
+
+@contextmanager
+def _index_lock(subreddit_dir):
+    """Hold the index directory's lock file, shared by every process using it.
+
+    Without fcntl (Windows) only the per-process locks of ensure_index apply.
+    """
+    out_dir = index_dir(subreddit_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, LOCK_FILENAME), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def build_index(subreddit_dir):
+    """Scan archive.json once and write the offset table and summary stats.
+
+    The stats in meta.json (post and comment counts, total score and date
+    range) are also what manifest.py summarizes the archive with.
+    """
+    with _index_lock(subreddit_dir):
+        return _build_index(subreddit_dir)
+
+
+def _build_index(subreddit_dir):
+    archive_path = os.path.join(subreddit_dir, 'archive.json')
+    out_dir = index_dir(subreddit_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    meta = _archive_stamp(archive_path)
+    meta['version'] = INDEX_VERSION
+    count = 0
+    total_score = 0
+    comment_count = 0
+    first = last = None
+    id_entries = []
+    feed = FeedIndexWriter()
+
+    offsets_path = os.path.join(out_dir, OFFSETS_FILENAME)
+    digests_path = os.path.join(out_dir, DIGESTS_FILENAME)
+    tmp_offsets = temp_path(offsets_path)
+    tmp_digests = temp_path(digests_path)
+    with open(archive_path, 'rb') as f, open(tmp_offsets, 'wb') as out, open(tmp_digests, 'wb') as digests:
+        if meta['archive_size'] > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                for offset, length in scan_records(buf):
+                    record = buf[offset:offset + length]
+                    post = json.loads(record)
+                    total_score += post.get('score') or 0
+                    comment_count += len(post.get('comments') or [])
+                    created = post.get('created_utc')
+                    if created is not None:
+                        first = created if first is None else min(first, created)
+                        last = created if last is None else max(last, created)
+                    post_id = str(post.get('id') or '').encode('utf-8')
+                    if 0 < len(post_id) <= 16:
+                        id_entries.append((post_id, offset, length))
+                    out.write(OFFSET_RECORD.pack(offset, length))
+                    digests.write(hashlib.blake2b(record, digest_size=DIGEST_SIZE).digest())
+                    feed.add(post)
+                    count += 1
+
+    meta['count'] = count
+    meta['total_score'] = total_score
+    meta['comment_count'] = comment_count
+    meta['first_post_utc'] = first
+    meta['last_post_utc'] = last
+
+    os.replace(tmp_offsets, offsets_path)
+    os.replace(tmp_digests, digests_path)
+    write_id_table(os.path.join(out_dir, IDS_FILENAME), id_entries)
+    feed.write(out_dir)
+    meta_path = os.path.join(out_dir, META_FILENAME)
+    tmp_meta = temp_path(meta_path)
+    with open(tmp_meta, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, meta_path)
+    return meta
+
+
+def _read_meta(subreddit_dir):
+    try:
+        with open(os.path.join(index_dir(subreddit_dir), META_FILENAME), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _is_current(meta, archive_path):
+    if not meta or meta.get('version') != INDEX_VERSION:
+        return False
+    stamp = _archive_stamp(archive_path)
+    return all(meta.get(key) == value for key, value in stamp.items())
+
+
+def ensure_index(subreddit_dir):
+    """Return the index for subreddit_dir, rebuilding it first if archive.json changed.
+
+    Returns None if the subreddit has no archive.json.
+    """
+    archive_path = os.path.join(subreddit_dir, 'archive.json')
+    if not os.path.exists(archive_path):
+        return None
+
+    meta = _read_meta(subreddit_dir)
+    if not _is_current(meta, archive_path):
+        with _build_locks_guard:
+            lock = _build_locks.setdefault(subreddit_dir, threading.Lock())
+        # The thread lock keeps this process's threads off the file lock,
+        # which other processes (serve.py workers, the CLI) wait on
+        with lock, _index_lock(subreddit_dir):
+            meta = _read_meta(subreddit_dir)
+            if not _is_current(meta, archive_path):
+                meta = _build_index(subreddit_dir)
+    return ArchiveIndex(subreddit_dir, meta)
+
+
+class ArchiveIndex:
+    """Random access to the posts of one archive.json via its offset table."""
+
+    def __init__(self, subreddit_dir, meta):
+        self.archive_path = os.path.join(subreddit_dir, 'archive.json')
+        self.offsets_path = os.path.join(index_dir(subreddit_dir), OFFSETS_FILENAME)
+        self.ids_path = os.path.join(index_dir(subreddit_dir), IDS_FILENAME)
+        self.digests_path = os.path.join(index_dir(subreddit_dir), DIGESTS_FILENAME)
+        self.meta = meta
+        stamp = (meta['archive_size'], meta['archive_mtime_ns'])
+        self.feed = load_feed_index(index_dir(subreddit_dir), meta['count'], stamp)
+
+        # Files replaced by a rebuild stay valid for whoever still holds the old mapping
+        cached = _mapped.get(subreddit_dir)
+        if cached is None or cached[0] != stamp:
+            maps = tuple(map_file(path) for path in (self.archive_path, self.offsets_path, self.ids_path, self.digests_path))
+            cached = _mapped[subreddit_dir] = (stamp, maps)
+        # digests holds DIGEST_SIZE bytes per post, in list order
+        self.archive, self.offsets, self.ids, self.digests = cached[1]
+
+    def warm(self):
+        """Ask the OS to read the index files (not the archive) into the page cache."""
+        for buf in (self.offsets, self.ids):
+            if isinstance(buf, mmap.mmap) and hasattr(mmap, 'MADV_WILLNEED'):
+                buf.madvise(mmap.MADV_WILLNEED)
+        self.feed.warm()
+
+    def __len__(self):
+        return self.meta['count']
+
+    @property
+    def total_score(self):
+        return self.meta['total_score']
+
+    def _offsets(self, start, stop):
+        return list(OFFSET_RECORD.iter_unpack(self.offsets[start * OFFSET_RECORD.size:stop * OFFSET_RECORD.size]))
+
+    def read_range(self, start, stop):
+        """Return the decoded posts with list positions start <= i < stop."""
+        start = max(0, start)
+        stop = min(len(self), stop)
+        if start >= stop:
+            return []
+
+        entries = self._offsets(start, stop)
+        first = entries[0][0]
+        last = entries[-1][0] + entries[-1][1]
+        # Consecutive posts are contiguous in the archive, so this is one slice
+        block = self.archive[first:last]
+        return [json.loads(block[offset - first:offset - first + length])
+                for offset, length in entries]
+
+    def iter_range(self, start, stop, chunk_size=256):
+        """Yield the posts with list positions start <= i < stop, reading chunk_size at a time."""
+        stop = min(len(self), stop)
+        for chunk_start in range(max(0, start), stop, chunk_size):
+            yield from self.read_range(chunk_start, min(chunk_start + chunk_size, stop))
+
+    def read(self, i):
+        posts = self.read_range(i, i + 1)
+        return posts[0] if posts else None
+
+    def read_raw(self, positions):
+        """Return the undecoded JSON of the posts at the given list positions, in that order."""
+        size = OFFSET_RECORD.size
+        entries = [OFFSET_RECORD.unpack_from(self.offsets, i * size) for i in positions]
+        return [self.archive[offset:offset + length] for offset, length in entries]
+
+    def locate(self, post_id):
+        """Return (offset, length) of the post with the given Reddit id, or None."""
+        key = post_id.encode('utf-8')
+        if not 0 < len(key) <= 16:
+            return None
+
+        slot_count = len(self.ids) // ID_RECORD.size
+        slot = _id_hash(key) & (slot_count - 1)
+        while True:
+            # Unpack a few neighbouring slots at once; probes rarely go further
+            window = self.ids[slot * ID_RECORD.size:(slot + ID_PROBE_WINDOW) * ID_RECORD.size]
+            for stored_id, offset, length in ID_RECORD.iter_unpack(window):
+                stored_id = stored_id.rstrip(b'\0')
+                if not stored_id:
+                    return None
+                if stored_id == key:
+                    return offset, length
+            slot += len(window) // ID_RECORD.size
+            if slot >= slot_count:
+                slot = 0
+
+    def read_id(self, post_id):
+        """Return the decoded post with the given Reddit id, or None."""
+        location = self.locate(post_id)
+        if location is None:
+            return None
+        offset, length = location
+        return json.loads(self.archive[offset:offset + length])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the post offset index for archived subreddits')
+    parser.add_argument('directories', nargs='+', help='Subreddit directories containing archive.json, e.g. ./r/Touhou')
+    args = parser.parse_args()
+
+    for directory in args.directories:
+        if not os.path.exists(os.path.join(directory, 'archive.json')):
+            print(f"Skipping {directory}: no archive.json")
+            continue
+        meta = build_index(directory)
+        print(f"Indexed {meta['count']} posts in {directory}")
+
+if __name__ == '__main__':
+    main()
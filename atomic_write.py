@@ -0,0 +1,49 @@
+import os
+import json
+import threading
+
+# Files that other processes may be reading while they change (archive.json, the
+# index files, manifests, export state) are written under a temporary name next
+# to them and swapped in with os.replace, so a reader sees the old file or the
+# new one, never half of either. The temporary name is unique to the writing
+# process and thread, so two writers of the same file don't share it.
+
+
+def temp_path(path):
+    """Name to write path under before swapping it in."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+class JsonListWriter:
+    """Writes a JSON list item by item, formatted as json.dump(items, f, indent=2, ensure_ascii=False) would.
+
+    The list is built under temp_path(path) and swapped in by close(), so the
+    previous file stays readable until the new one is complete.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._tmp_path = temp_path(path)
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+        self._file.write('[')
+
+    def add(self, item):
+        self._file.write(',\n  ' if self.count else '\n  ')
+        # Newlines inside strings are escaped, so every newline here is formatting
+        self._file.write(json.dumps(item, indent=2, ensure_ascii=False).replace('\n', '\n  '))
+        self.count += 1
+
+    def close(self):
+        self._file.write('\n]' if self.count else ']')
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+
+def write_json_list(path, items):
+    """Write items without holding them all in memory. Returns how many were written."""
+    writer = JsonListWriter(path)
+    for item in items:
+        writer.add(item)
+    writer.close()
+    return writer.count
@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+from storage import JsonArchiveStore
+from archive_index import ensure_index, index_dir
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is left out there
+    resource = None
+
+# Compares the memory a loaded archive costs as plain dicts (json.load of
+# archive.json) against the store the viewer serves it from. Each model runs in
+# a fresh process that serves the first page, a sorted page and a filtered page,
+# and reports how much its RSS, unique set size (USS) and anonymous memory grew.
+# The store maps archive.json and its index files, so its RSS and USS include
+# the pages it touched; those are clean file pages the OS shares between
+# workers and can drop under pressure. Anonymous memory is what each worker
+# really keeps for itself.
+PAGE_SIZE = 25
+SORTED_PAGE = {'sort': 'top'}
+FILTERED_PAGE = {'filters': {'media': True}}
+SMAPS_ROLLUP = '/proc/self/smaps_rollup'
+
+
+def memory_mb():
+    """Current RSS, USS and anonymous memory in MB, or None where /proc isn't available."""
+    try:
+        with open(SMAPS_ROLLUP) as f:
+            fields = {line.split(':')[0]: int(line.split()[1]) for line in f if line.endswith('kB\n')}
+    except OSError:
+        return None
+    return {
+        'rss_mb': fields['Rss'] / 1024,
+        'uss_mb': (fields['Private_Clean'] + fields['Private_Dirty']) / 1024,
+        'anon_mb': fields['Anonymous'] / 1024
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def mapped_files_mb(directory):
+    """Size of the files the indexed store maps: archive.json and its index."""
+    paths = [os.path.join(directory, 'archive.json')]
+    index_path = index_dir(directory)
+    paths += [os.path.join(index_path, name) for name in os.listdir(index_path)]
+    return round(sum(os.path.getsize(path) for path in paths if os.path.isfile(path)) / 1024 ** 2, 2)
+
+
+def serve_dicts(directory):
+    with open(os.path.join(directory, 'archive.json'), 'r', encoding='utf-8') as f:
+        posts = json.load(f)
+    pages = [
+        posts[:PAGE_SIZE],
+        sorted(posts, key=lambda post: post.get('score') or 0, reverse=True)[:PAGE_SIZE],
+        [post for post in posts if post.get('local_media')][:PAGE_SIZE]
+    ]
+    return (posts, pages), len(posts)
+
+
+def serve_indexed(directory):
+    # Always archive.json, even next to an archive.db
+    store = JsonArchiveStore(ensure_index(directory))
+    pages = [list(store.page(0, PAGE_SIZE))]
+    for query in (SORTED_PAGE, FILTERED_PAGE):
+        posts, _ = store.query(limit=PAGE_SIZE, **query)
+        pages.append(list(posts))
+    return (store, pages), store.count()
+
+
+MODELS = {
+    'dict': serve_dicts,
+    'indexed': serve_indexed
+}
+
+
+def run_model(name, directory):
+    """Runs in the child process: load, serve the pages and print one result as JSON."""
+    before = memory_mb()
+    start_time = time.time()
+    result, count = MODELS[name](directory)
+    elapsed = time.time() - start_time
+    after = memory_mb()
+    report = {'model': name, 'posts': count, 'seconds': round(elapsed, 3), 'peak_rss_mb': peak_rss_mb()}
+    if before and after:
+        report.update({key: round(after[key] - before[key], 2) for key in after})
+    print(json.dumps(report))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory use of dict-loaded archives with the viewer's indexed store")
+    parser.add_argument('directory', help='Subreddit directory containing archive.json, e.g. ./r/Touhou')
+    parser.add_argument('-o', '--output', help='Also write the results to this JSON file')
+    # Used by the parent to build the index and measure each model in child processes
+    parser.add_argument('--run-model', choices=list(MODELS), help=argparse.SUPPRESS)
+    parser.add_argument('--build-index', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.build_index:
+        ensure_index(args.directory)
+        return
+    if args.run_model:
+        run_model(args.run_model, args.directory)
+        return
+
+    archive_path = os.path.join(args.directory, 'archive.json')
+    if not os.path.exists(archive_path):
+        print(f"Error: {archive_path} does not exist")
+        exit(1)
+
+    # Build the offset and feed index up front, in a process of its own: the
+    # models' children would inherit this process's peak RSS
+    subprocess.run([sys.executable, os.path.abspath(__file__), args.directory, '--build-index'], check=True)
+
+    results = []
+    for name in MODELS:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), args.directory, '--run-model', name],
+                               capture_output=True, text=True)
+        if child.returncode != 0:
+            print(f"Error measuring {name}: {(child.stderr.strip().splitlines() or ['exit code %d' % child.returncode])[-1]}")
+            exit(1)
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+    results[1]['mapped_files_mb'] = mapped_files_mb(args.directory)
+
+    for result in results:
+        line = f"{result['model']:>8}: {result['posts']} posts in {result['seconds']}s, peak RSS {result['peak_rss_mb']} MB"
+        if 'rss_mb' in result:
+            line += f", +{result['rss_mb']} MB RSS, +{result['uss_mb']} MB USS, +{result['anon_mb']} MB anonymous"
+        print(line)
+    print(f"The indexed store maps {results[1]['mapped_files_mb']} MB of archive and index files, shared through the page cache")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
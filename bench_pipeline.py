@@ -0,0 +1,319 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from statistics import median
+from urllib.parse import quote
+
+import synth_archive
+from pipeline import load_script
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is left out there
+    resource = None
+
+# Times every offline stage and the viewer on synthetic archives of several
+# sizes (see synth_archive.py) and reports seconds and peak RSS as JSON, so runs
+# before and after a change can be compared. Each stage runs in a fresh process,
+# so its peak memory isn't hidden by an earlier stage's. Setup work such as
+# copying the input is done before the clock starts and is not counted.
+DEFAULT_SCALES = [1000, 10000, 50000]
+DEFAULT_REQUESTS = 20
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def quiet(function, *args):
+    """Call function with its progress output discarded."""
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            return function(*args)
+        finally:
+            sys.stdout = stdout
+
+
+def count_files(directory):
+    return sum(len(files) for _, _, files in os.walk(directory))
+
+
+# Each stage takes (data_dir, work_dir, args), does its setup and returns a
+# function to time. That function returns a dict of extra fields for the report.
+
+def stage_filter_entries(data_dir, work_dir, args):
+    strip = load_script('3-strip_txt.py')
+    source, output = os.path.join(data_dir, 'terms.txt'), os.path.join(work_dir, 'terms-filtered.txt')
+
+    def run():
+        strip.filter_entries(source, output)
+        with open(output, encoding='utf-8') as f:
+            return {'terms_kept': sum(1 for _ in f)}
+    return run
+
+
+def stage_merge_and_deduplicate_files(data_dir, work_dir, args):
+    merge = load_script('4-merge-and-remove-duplicates.py')
+    output = os.path.join(work_dir, 'merged', 'archive.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    def run():
+        quiet(merge.merge_and_deduplicate_files, os.path.join(data_dir, 'search-results'), output)
+        return {'output_mb': round(os.path.getsize(output) / 1024 ** 2, 1)}
+    return run
+
+
+def copy_media(data_dir, work_dir, subreddit):
+    source = os.path.join(work_dir, 'media')
+    shutil.rmtree(source, ignore_errors=True)
+    shutil.copytree(os.path.join(data_dir, 'search-results', 'media', subreddit), source)
+    return source
+
+
+def stage_move_media_files(data_dir, work_dir, args):
+    move = load_script('5-merge-search-results-folders.py')
+    source = copy_media(data_dir, work_dir, args.subreddit)
+    output = os.path.join(work_dir, 'merged-media')
+    shutil.rmtree(output, ignore_errors=True)
+
+    def run():
+        quiet(move.move_media_files, source, output)
+        return {'files': count_files(output)}
+    return run
+
+
+def stage_find_and_remove_duplicates(data_dir, work_dir, args):
+    move = load_script('5-merge-search-results-folders.py')
+    dedupe = load_script('6-delete-dupes.py')
+    # The input is what 5-merge-search-results-folders.py leaves behind
+    output = os.path.join(work_dir, 'merged-media')
+    shutil.rmtree(output, ignore_errors=True)
+    quiet(move.move_media_files, copy_media(data_dir, work_dir, args.subreddit), output)
+    before = count_files(output)
+
+    def run():
+        quiet(dedupe.find_and_remove_duplicates, output)
+        return {'files_before': before, 'files_after': count_files(output)}
+    return run
+
+
+def stage_build_index(data_dir, work_dir, args):
+    from archive_index import INDEX_DIRNAME, build_index
+    subreddit_dir = os.path.join(data_dir, 'r', args.subreddit)
+    shutil.rmtree(os.path.join(subreddit_dir, INDEX_DIRNAME), ignore_errors=True)
+
+    def run():
+        build_index(subreddit_dir)
+        return {}
+    return run
+
+
+def stage_build_search_index(data_dir, work_dir, args):
+    from storage import open_store
+    from archive_index import index_dir
+    from search_index import SEARCH_FILENAME, ensure_search_index
+    subreddit_dir = os.path.join(data_dir, 'r', args.subreddit)
+    store = open_store(subreddit_dir)
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(os.path.join(index_dir(subreddit_dir), SEARCH_FILENAME + suffix))
+        except FileNotFoundError:
+            pass
+
+    def run():
+        ensure_search_index(subreddit_dir, store).close()
+        return {}
+    return run
+
+
+def viewer(data_dir, args):
+    """The viewer pointed at the generated archive, with its indexes already built."""
+    import app
+    from storage import open_store
+    from search_index import ensure_search_index
+    app.ARCHIVES_DIR = os.path.join(data_dir, 'r')
+    store = open_store(os.path.join(app.ARCHIVES_DIR, args.subreddit))
+    ensure_search_index(os.path.join(app.ARCHIVES_DIR, args.subreddit), store).close()
+    store.close()
+    return app
+
+
+def stage_load_posts(data_dir, work_dir, args):
+    app = viewer(data_dir, args)
+
+    def run():
+        return {'loaded': len(app.load_posts(args.subreddit))}
+    return run
+
+
+def stage_routes(data_dir, work_dir, args):
+    app = viewer(data_dir, args)
+    subreddit = args.subreddit
+    with open(os.path.join(data_dir, 'terms.txt'), encoding='utf-8') as f:
+        term = quote(f.readline().strip())
+    middle_id = synth_archive.base36(synth_archive.FIRST_ID + args.posts // 2)
+    routes = {
+        'subreddits': '/r/',
+        'feed': f'/r/{subreddit}',
+        'feed_deep_page': f'/r/{subreddit}?offset={max(0, args.posts - 50)}',
+        'feed_top_media': f'/r/{subreddit}?sort=top&media=1',
+        'post': f'/r/{subreddit}/comments/{middle_id}',
+        'search': f'/r/{subreddit}?q={term}',
+        'api_posts': f'/api/v2/r/{subreddit}/posts?limit=100',
+        'api_all_posts': f'/api/r/{subreddit}/posts',
+        'api_search': f'/api/r/{subreddit}/search?q={term}'
+    }
+    client = app.app.test_client()
+
+    def run():
+        timings = {}
+        for name, url in routes.items():
+            seconds = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                # Reading data consumes streamed responses too
+                response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+                size = len(response.data)
+                seconds.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{url} answered {response.status_code}")
+            timings[name] = {
+                'first': round(seconds[0], 4),
+                'median': round(median(seconds), 4),
+                'max': round(max(seconds), 4),
+                'bytes': size
+            }
+        return {'routes': timings}
+    return run
+
+
+STAGES = {
+    'filter_entries': stage_filter_entries,
+    'merge_and_deduplicate_files': stage_merge_and_deduplicate_files,
+    'move_media_files': stage_move_media_files,
+    'find_and_remove_duplicates': stage_find_and_remove_duplicates,
+    'build_index': stage_build_index,
+    'build_search_index': stage_build_search_index,
+    'load_posts': stage_load_posts,
+    'routes': stage_routes
+}
+
+
+def run_stage(name, data_dir, work_dir, args):
+    """Runs in the child process: set up, time and print one result as JSON."""
+    os.makedirs(work_dir, exist_ok=True)
+    run = STAGES[name](data_dir, work_dir, args)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    extra = run()
+    result = {'seconds': round(time.perf_counter() - start, 4), 'peak_rss_mb': peak_rss_mb(), 'baseline_rss_mb': baseline}
+    result.update(extra)
+    print(json.dumps(result))
+
+
+def generator_args(args):
+    return ['--comments', str(args.comments), '--duplicate-rate', str(args.duplicate_rate),
+            '--media-rate', str(args.media_rate), '--seed', str(args.seed), '-s', args.subreddit,
+            '--requests', str(args.requests)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline scripts and the viewer on synthetic archives')
+    parser.add_argument('-n', '--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help=f'Archive sizes in posts (default: {" ".join(map(str, DEFAULT_SCALES))})')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES), help='Stages to run (default: all)')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file')
+    parser.add_argument('-d', '--data', help='Keep generated archives in this folder and reuse them on the next run')
+    parser.add_argument('-s', '--subreddit', default=synth_archive.DEFAULT_SUBREDDIT, help=argparse.SUPPRESS)
+    parser.add_argument('--comments', type=float, default=synth_archive.DEFAULT_COMMENTS_MEDIAN, help='Median comments per post')
+    parser.add_argument('--duplicate-rate', type=float, default=synth_archive.DEFAULT_DUPLICATE_RATE,
+                        help='Share of posts found by more than one search term')
+    parser.add_argument('--media-rate', type=float, default=synth_archive.DEFAULT_MEDIA_RATE, help='Share of posts with media')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS,
+                        help=f'Requests per route in the routes stage (default: {DEFAULT_REQUESTS})')
+    parser.add_argument('--timeout', type=float, help='Give up on a stage after this many seconds')
+    # Used by the parent to run one stage in a child process
+    parser.add_argument('--run-stage', nargs=3, metavar=('STAGE', 'DATA', 'WORK'), help=argparse.SUPPRESS)
+    parser.add_argument('--posts', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        name, data_dir, work_dir = args.run_stage
+        run_stage(name, data_dir, work_dir, args)
+        return
+
+    root = args.data or tempfile.mkdtemp(prefix='bench-pipeline-')
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'settings': {key: getattr(args, key) for key in ('comments', 'duplicate_rate', 'media_rate', 'seed', 'requests')},
+        'results': []
+    }
+    try:
+        for posts in args.scales:
+            data_dir = os.path.join(root, str(posts), 'data')
+            work_dir = os.path.join(root, str(posts), 'work')
+            settings_path = os.path.join(data_dir, 'settings.json')
+            settings = [posts, args.subreddit, args.comments, args.duplicate_rate, args.media_rate, args.seed]
+            try:
+                with open(settings_path) as f:
+                    reuse = json.load(f) == settings
+            except (FileNotFoundError, json.JSONDecodeError):
+                reuse = False
+
+            if not reuse:
+                shutil.rmtree(data_dir, ignore_errors=True)
+                start = time.perf_counter()
+                generator = synth_archive.Generator(posts, args.subreddit, args.comments, args.duplicate_rate,
+                                                    args.media_rate, seed=args.seed)
+                stats = synth_archive.generate(data_dir, generator)
+                print(f"Generated {posts} posts, {stats['comments']} comments, {stats['media_files']} media files "
+                      f"in {time.perf_counter() - start:.1f}s")
+                with open(settings_path, 'w') as f:
+                    json.dump(settings, f)
+
+            for name in args.stages:
+                command = [sys.executable, os.path.abspath(__file__), '--run-stage', name, data_dir, work_dir,
+                           '--posts', str(posts)] + generator_args(args)
+                result = {'posts': posts, 'stage': name}
+                try:
+                    child = subprocess.run(command, capture_output=True, text=True, timeout=args.timeout)
+                    if child.returncode == 0:
+                        result.update(json.loads(child.stdout.strip().splitlines()[-1]))
+                    else:
+                        result['error'] = (child.stderr.strip().splitlines() or ['exit code %d' % child.returncode])[-1]
+                except subprocess.TimeoutExpired:
+                    result['error'] = f'timed out after {args.timeout}s'
+                report['results'].append(result)
+
+                if 'error' in result:
+                    print(f"{posts:>8} {name:<28} failed: {result['error']}")
+                else:
+                    print(f"{posts:>8} {name:<28} {result['seconds']:>9.3f}s  peak {result['peak_rss_mb']} MB")
+                    for route, timing in result.get('routes', {}).items():
+                        print(f"{'':>8}   {route:<26} {timing['median'] * 1000:>8.1f}ms median, {timing['first'] * 1000:.1f}ms first")
+    finally:
+        if not args.data:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+import os
+import re
+import json
+import time
+import zlib
+import shutil
+import hashlib
+import argparse
+import tempfile
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import app as viewer
+from storage import open_store, store_stamp
+from search_index import searchable_text, RANK_WEIGHTS
+from atomic_write import temp_path
+
+# Renders archived subreddits to plain files that any static web server can host:
+#   r/index.html                         subreddit list
+#   r/<sub>/index.html                   first page of the feed
+#   r/<sub>/page/<n>.html                further pages as post cards, for infinite scroll
+#   r/<sub>/comments/<id>/index.html     one page per post
+#   r/<sub>/search/terms/<prefix>.json   search index, sharded by the first letters of each word
+#   r/<sub>/search/splits.json           prefixes whose shard was split by one more letter
+#   r/<sub>/search/docs/<n>.json         titles of the search results
+# Pages are produced by the viewer itself, in a pool of processes. A digest of
+# every post is kept between runs so a re-export only rewrites the post pages and
+# feed pages whose posts changed.
+EXPORT_STATE_FILENAME = '.export.json'
+EXPORT_VERSION = 2
+# Pages rendered per task handed to a worker
+CHUNK_SIZE = 200
+
+SEARCH_SHARD_PREFIX = 2
+# A shard larger than this is split by one more letter of its prefix, so the
+# number of shards grows with the archive instead of their size
+SEARCH_SHARD_BYTES = 256 * 1024
+# Postings are spilled to this many temporary files while an archive is scanned
+SEARCH_SPILL_FILES = 64
+SEARCH_SPLITS_FILENAME = 'splits.json'
+SEARCH_MIN_WORD = 2
+SEARCH_MAX_WORD = 40
+SEARCH_DOCS_PER_SHARD = 1000
+SEARCH_MAX_RESULTS = 100
+WORD = re.compile(r'\w+')
+# Post ids become directory names
+SAFE_ID = re.compile(r'\w+')
+
+# Read by the templates (as config.*) so exported pages work without the server
+STATIC_CONFIG = {
+    'STATIC_EXPORT': True,
+    'SEARCH_SHARD_PREFIX': SEARCH_SHARD_PREFIX,
+    'SEARCH_MIN_WORD': SEARCH_MIN_WORD,
+    'SEARCH_DOCS_PER_SHARD': SEARCH_DOCS_PER_SHARD,
+    'SEARCH_MAX_RESULTS': SEARCH_MAX_RESULTS
+}
+
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def post_digest(post):
+    return digest(json.dumps(post, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+
+
+def search_terms(post):
+    """Weight of every indexed word in a post, using the same field weights as search_index.py."""
+    weights = defaultdict(int)
+    for text, weight in zip(searchable_text(post), RANK_WEIGHTS):
+        for word in WORD.findall(text.lower()):
+            if SEARCH_MIN_WORD <= len(word) <= SEARCH_MAX_WORD:
+                weights[word] += int(weight)
+    return weights
+
+
+def term_shard(prefix):
+    return prefix.encode('utf-8').hex()
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_state(site_dir):
+    try:
+        with open(os.path.join(site_dir, EXPORT_STATE_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_state(site_dir, state):
+    path = os.path.join(site_dir, EXPORT_STATE_FILENAME)
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _init_worker(archives_dir, listed):
+    viewer.ARCHIVES_DIR = archives_dir
+    viewer.LISTED_SUBREDDITS = listed
+    viewer.app.config.update(STATIC_CONFIG)
+
+
+def exported_subreddits(subreddits, archives_dir, out_dir):
+    """Subreddits the site will contain: those being exported and those from earlier runs."""
+    site_dir = os.path.join(out_dir, 'r')
+    names = set(subreddits)
+    if os.path.isdir(site_dir):
+        names.update(name for name in os.listdir(site_dir)
+                     if os.path.exists(os.path.join(site_dir, name, EXPORT_STATE_FILENAME)))
+    return sorted(name for name in names if store_stamp(os.path.join(archives_dir, name)) is not None)
+
+
+def _render(jobs):
+    """Fetch each (url, path, key) through the viewer and save it. Returns (bytes, failed keys)."""
+    client = viewer.app.test_client()
+    written = 0
+    failed = []
+    for url, path, key in jobs:
+        response = client.get(url)
+        if response.status_code != 200:
+            print(f"Error rendering {url}: {response.status_code}")
+            failed.append(key)
+            continue
+        write_file(path, response.data)
+        written += len(response.data)
+    return written, failed
+
+
+def export_media(subreddit_dir, site_dir, mode):
+    for folder in ('images', 'videos'):
+        source = os.path.abspath(os.path.join(subreddit_dir, folder))
+        dest = os.path.join(site_dir, folder)
+        if mode == 'none' or not os.path.isdir(source) or os.path.islink(dest):
+            continue
+        if mode == 'link':
+            try:
+                os.symlink(source, dest, target_is_directory=True)
+                continue
+            except OSError as e:
+                # Creating symlinks needs extra privileges on Windows
+                print(f"Could not link {dest} ({e}), copying instead")
+        shutil.copytree(source, dest, dirs_exist_ok=True)
+
+
+class SearchIndexWriter:
+    """Writes the static search index of one subreddit without holding it in memory.
+
+    While the archive is scanned, titles are written a shard at a time and
+    postings are appended to temporary spill files, each holding whole groups of
+    terms that share their first SEARCH_SHARD_PREFIX letters. close() then loads
+    one spill file at a time and writes its groups as term shards, splitting any
+    shard larger than SEARCH_SHARD_BYTES by one more letter. Shards whose content
+    didn't change since the last export are left alone.
+    """
+
+    def __init__(self, search_dir, old_digests):
+        self.search_dir = search_dir
+        self.old_digests = old_digests
+        self.digests = {'terms': {}, 'docs': {}}
+        self.splits = []
+        self.count = 0
+        self._docs = []
+        self._spill_dir = tempfile.mkdtemp(prefix='export-search-')
+        self._spills = [open(os.path.join(self._spill_dir, str(i)), 'w', encoding='utf-8')
+                        for i in range(SEARCH_SPILL_FILES)]
+
+    def add(self, post_id, post):
+        doc = self.count
+        self.count += 1
+        self._docs.append([post_id, post.get('title') or '', post.get('author') or '[deleted]', post.get('score') or 0])
+        if len(self._docs) == SEARCH_DOCS_PER_SHARD:
+            self._write_docs()
+        for term, weight in search_terms(post).items():
+            spill = zlib.crc32(term[:SEARCH_SHARD_PREFIX].encode('utf-8')) % SEARCH_SPILL_FILES
+            self._spills[spill].write(f"{term}\t{doc}\t{weight}\n")
+
+    def close(self):
+        """Write the term shards and remove stale ones. Returns the new shard digests."""
+        if self._docs:
+            self._write_docs()
+        try:
+            for spill in self._spills:
+                spill.close()
+            for i in range(SEARCH_SPILL_FILES):
+                self._write_terms(os.path.join(self._spill_dir, str(i)))
+        finally:
+            self.discard()
+
+        splits = json.dumps(sorted(self.splits), ensure_ascii=False).encode('utf-8')
+        self.digests['splits'] = digest(splits)
+        if self.old_digests.get('splits') != self.digests['splits']:
+            write_file(os.path.join(self.search_dir, SEARCH_SPLITS_FILENAME), splits)
+        for kind in ('terms', 'docs'):
+            for name in set(self.old_digests.get(kind, {})) - set(self.digests[kind]):
+                try:
+                    os.remove(os.path.join(self.search_dir, kind, f"{name}.json"))
+                except FileNotFoundError:
+                    pass
+        return self.digests
+
+    def discard(self):
+        """Remove the spill files."""
+        for spill in self._spills:
+            spill.close()
+        shutil.rmtree(self._spill_dir, ignore_errors=True)
+
+    def _write(self, kind, name, encoded):
+        self.digests[kind][name] = digest(encoded)
+        if self.old_digests.get(kind, {}).get(name) != self.digests[kind][name]:
+            write_file(os.path.join(self.search_dir, kind, f"{name}.json"), encoded)
+
+    def _write_docs(self):
+        name = str((self.count - 1) // SEARCH_DOCS_PER_SHARD)
+        self._write('docs', name, json.dumps(self._docs, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        self._docs = []
+
+    def _write_terms(self, spill_path):
+        postings = defaultdict(lambda: array('I'))
+        with open(spill_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                term, doc, weight = line.split('\t')
+                postings[term].extend((int(doc), int(weight)))
+        # Each term's postings are encoded once and reused for sizing and writing
+        groups = defaultdict(dict)
+        for term in list(postings):
+            groups[term[:SEARCH_SHARD_PREFIX]][term] = json.dumps(postings.pop(term).tolist(), separators=(',', ':'))
+        for prefix, terms in groups.items():
+            for shard_prefix, shard_terms in self._split(prefix, terms):
+                encoded = ','.join(f"{json.dumps(term, ensure_ascii=False)}:{values}" for term, values in shard_terms.items())
+                self._write('terms', term_shard(shard_prefix), f"{{{encoded}}}".encode('utf-8'))
+
+    def _split(self, prefix, terms):
+        """Yield (prefix, terms) shards, splitting by the next letter while a shard is too large."""
+        size = sum(len(term) + len(values) + 4 for term, values in terms.items())
+        if size <= SEARCH_SHARD_BYTES or all(len(term) == len(prefix) for term in terms):
+            yield prefix, terms
+            return
+        # The shard of a split prefix keeps only the term equal to the prefix
+        self.splits.append(prefix)
+        children = defaultdict(dict)
+        for term, values in terms.items():
+            if len(term) == len(prefix):
+                yield prefix, {term: values}
+            else:
+                children[term[:len(prefix) + 1]][term] = values
+        for child, child_terms in children.items():
+            yield from self._split(child, child_terms)
+
+
+def plan_subreddit(subreddit, archives_dir, out_dir, page_size, layout, full=False):
+    """Scan one archive, write its search index and return (render jobs, new export state)."""
+    subreddit_dir = os.path.join(archives_dir, subreddit)
+    site_dir = os.path.join(out_dir, 'r', subreddit)
+    store = open_store(subreddit_dir)
+    if store is None:
+        return [], None
+
+    state = read_state(site_dir)
+    search_dir = os.path.join(site_dir, 'search')
+    if full or state.get('layout') != layout:
+        state = {}
+        # Shards of another layout aren't in the state, so they would never be removed
+        shutil.rmtree(search_dir, ignore_errors=True)
+    old_posts = state.get('posts', {})
+    old_pages = state.get('pages', [])
+
+    posts = {}
+    pages = []
+    page_hash = hashlib.blake2b(digest_size=16)
+    search = SearchIndexWriter(search_dir, state.get('shards', {}))
+    try:
+        for position, post in enumerate(store.iter_posts()):
+            post_digest_hex = post_digest(post)
+            page_hash.update(post_digest_hex.encode())
+            if (position + 1) % page_size == 0:
+                pages.append(page_hash.hexdigest())
+                page_hash = hashlib.blake2b(digest_size=16)
+
+            post_id = post.get('id')
+            if not post_id or post_id in posts or not SAFE_ID.fullmatch(post_id):
+                continue
+            posts[post_id] = post_digest_hex
+            search.add(post_id, post)
+        if store.count() % page_size:
+            pages.append(page_hash.hexdigest())
+    except BaseException:
+        search.discard()
+        raise
+    finally:
+        store.close()
+    shards = search.close()
+
+    # Keys name the digest to forget if the page fails, so the next export retries it
+    jobs = [(f"/r/{subreddit}?limit={page_size}", os.path.join(site_dir, 'index.html'), None)]
+    for post_id, post_digest_hex in posts.items():
+        if old_posts.get(post_id) != post_digest_hex:
+            jobs.append((f"/r/{subreddit}/comments/{post_id}",
+                         os.path.join(site_dir, 'comments', post_id, 'index.html'), ('post', post_id)))
+    for post_id in set(old_posts) - set(posts):
+        shutil.rmtree(os.path.join(site_dir, 'comments', post_id), ignore_errors=True)
+
+    # Page 1 is index.html; the rest are fetched by infinite scroll
+    for number in range(2, len(pages) + 1):
+        if number > len(old_pages) or old_pages[number - 1] != pages[number - 1]:
+            jobs.append((f"/r/{subreddit}?offset={(number - 1) * page_size}&limit={page_size}&fragment=1",
+                         os.path.join(site_dir, 'page', f"{number}.html"), ('page', number)))
+    for number in range(len(pages) + 1, len(old_pages) + 1):
+        try:
+            os.remove(os.path.join(site_dir, 'page', f"{number}.html"))
+        except FileNotFoundError:
+            pass
+
+    return jobs, {'layout': layout, 'posts': posts, 'pages': pages, 'shards': shards}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export archived subreddits as a static website')
+    parser.add_argument('subreddits', nargs='*', help='Subreddits to export (default: all)')
+    parser.add_argument('-i', '--input', default=viewer.ARCHIVES_DIR, help='Folder containing the subreddit folders (default: ./r)')
+    parser.add_argument('-o', '--output', required=True, help='Output folder for the website')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--page-size', type=int, default=viewer.PAGE_SIZE, help='Posts per feed page')
+    parser.add_argument('--media', choices=['link', 'copy', 'none'], default='link', help='Symlink, copy or leave out images and videos')
+    parser.add_argument('--full', action='store_true', help='Rewrite every page instead of only changed ones')
+    args = parser.parse_args()
+
+    if not 1 <= args.page_size <= viewer.MAX_PAGE_SIZE:
+        parser.error(f'--page-size must be between 1 and {viewer.MAX_PAGE_SIZE}')
+
+    archives_dir = os.path.abspath(args.input)
+    viewer.ARCHIVES_DIR = archives_dir
+    subreddits = args.subreddits or viewer.get_available_subreddits()
+    start_time = time.time()
+
+    # The subreddit list and the sidebar of every post page only show exported
+    # subreddits, so adding one rewrites them all
+    listed = exported_subreddits(subreddits, archives_dir, args.output)
+    viewer.LISTED_SUBREDDITS = listed
+    layout = [EXPORT_VERSION, viewer.BUILD_STAMP, args.page_size, listed]
+
+    jobs = [('/r/', os.path.join(args.output, 'r', 'index.html'), None)]
+    states = {}
+    for subreddit in subreddits:
+        subreddit_jobs, state = plan_subreddit(subreddit, archives_dir, args.output, args.page_size, layout, args.full)
+        if state is None:
+            print(f"Skipping r/{subreddit}: no archive")
+            continue
+        jobs += [(url, path, (subreddit, key)) for url, path, key in subreddit_jobs]
+        states[subreddit] = state
+        export_media(os.path.join(archives_dir, subreddit), os.path.join(args.output, 'r', subreddit), args.media)
+    write_file(os.path.join(args.output, 'index.html'),
+               b'<!DOCTYPE html><meta http-equiv="refresh" content="0; url=/r/">')
+    print(f"Rendering {len(jobs)} pages...")
+
+    written = 0
+    chunks = [jobs[i:i + CHUNK_SIZE] for i in range(0, len(jobs), CHUNK_SIZE)]
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(archives_dir, listed)) as executor:
+        for size, failed in executor.map(_render, chunks):
+            written += size
+            # Forget the digests of failed pages so the next export renders them again
+            for subreddit, (kind, value) in (job_key for job_key in failed if job_key and job_key[1]):
+                if kind == 'post':
+                    states[subreddit]['posts'].pop(value, None)
+                else:
+                    states[subreddit]['pages'][value - 1] = None
+
+    for subreddit, state in states.items():
+        write_state(os.path.join(args.output, 'r', subreddit), state)
+    print(f"Exported {len(states)} subreddits to {args.output}: {len(jobs)} pages, "
+          f"{written / 1024 ** 2:.1f} MB in {time.time() - start_time:.2f} seconds")
+
+if __name__ == '__main__':
+    main()
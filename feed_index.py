@@ -0,0 +1,196 @@
+import os
+import mmap
+from array import array
+from bisect import bisect_left
+
+from atomic_write import temp_path
+
+# Precomputed orderings and filters for the feed of one archive.json, written
+# next to its offset table. Each sort is an array of list positions ordered by
+# its key, and each filter is a bitmap with one bit per post, so "top videos of
+# 2023" is a binary search on the date order, an AND of two bitmaps and a walk
+# down the score order, without decoding a single post.
+SORT_KEYS = {
+    'top': 'score',
+    'new': 'created_utc',
+    'old': 'created_utc',
+    'comments': 'num_comments'
+}
+# Sorts that show the highest key first
+DESCENDING_SORTS = {'top', 'new', 'comments'}
+FILTERS = ('media', 'gallery', 'video', 'nsfw')
+
+VIDEO_EXTENSIONS = ('.mp4', '.webm')
+# Date ranges are answered from the created_utc order and its sorted keys
+CREATED_KEYS_FILENAME = 'created_utc.bin'
+
+
+def order_filename(key):
+    return f"order_{key}.bin"
+
+
+def bitmap_filename(name):
+    return f"bitmap_{name}.bin"
+
+
+def post_filters(post):
+    """Which of FILTERS apply to a post, as a tuple of booleans in FILTERS order."""
+    media = post.get('local_media') or []
+    if isinstance(media, str):
+        media = [media]
+    return (
+        bool(media),
+        bool(post.get('is_gallery')),
+        bool(post.get('is_video')) or any(path.lower().endswith(VIDEO_EXTENSIONS) for path in media),
+        bool(post.get('over_18'))
+    )
+
+
+class FeedIndexWriter:
+    """Collects sort keys and filter bits while the offset index scans an archive."""
+
+    def __init__(self):
+        self.keys = {key: [] for key in set(SORT_KEYS.values())}
+        self.bitmaps = {name: bytearray() for name in FILTERS}
+        self.count = 0
+
+    def add(self, post):
+        for key, values in self.keys.items():
+            values.append(post.get(key) or 0)
+        byte, bit = divmod(self.count, 8)
+        for name, flag in zip(FILTERS, post_filters(post)):
+            bitmap = self.bitmaps[name]
+            if bit == 0:
+                bitmap.append(0)
+            if flag:
+                bitmap[byte] |= 1 << bit
+        self.count += 1
+
+    def write(self, out_dir):
+        for key, values in self.keys.items():
+            # sorted() is stable, so equal keys keep archive order
+            order = array('I', sorted(range(self.count), key=values.__getitem__))
+            _write(os.path.join(out_dir, order_filename(key)), order.tobytes())
+            if key == 'created_utc':
+                created = array('d', (values[i] for i in order))
+                _write(os.path.join(out_dir, CREATED_KEYS_FILENAME), created.tobytes())
+        for name, bitmap in self.bitmaps.items():
+            _write(os.path.join(out_dir, bitmap_filename(name)), bytes(bitmap))
+
+
+def _write(path, data):
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# Loaded indexes by directory, kept while the archive they were built from is unchanged
+_loaded = {}
+
+
+def load_feed_index(out_dir, count, stamp):
+    """Return the FeedIndex in out_dir, reusing the one already in memory if stamp matches."""
+    cached = _loaded.get(out_dir)
+    if cached is None or cached[0] != stamp:
+        cached = _loaded[out_dir] = (stamp, FeedIndex(out_dir, count))
+    return cached[1]
+
+
+class FeedIndex:
+    """Read side of the files written by FeedIndexWriter. Files are loaded on first use."""
+
+    def __init__(self, out_dir, count):
+        self.out_dir = out_dir
+        self.count = count
+        self._arrays = {}
+
+    def _array(self, filename, typecode):
+        if filename not in self._arrays:
+            with open(os.path.join(self.out_dir, filename), 'rb') as f:
+                if os.name == 'nt' or os.fstat(f.fileno()).st_size == 0:
+                    # Windows can't replace mapped files, so it gets a private copy
+                    values = array(typecode)
+                    values.frombytes(f.read())
+                else:
+                    # Shared with every other process through the page cache
+                    values = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast(typecode)
+            self._arrays[filename] = values
+        return self._arrays[filename]
+
+    def warm(self):
+        """Load every order and key file so the first sorted page doesn't have to."""
+        for key in set(SORT_KEYS.values()):
+            self._array(order_filename(key), 'I')
+        self._array(CREATED_KEYS_FILENAME, 'd')
+
+    def _order(self, sort):
+        return self._array(order_filename(SORT_KEYS[sort]), 'I')
+
+    def _bitmap(self, name):
+        with open(os.path.join(self.out_dir, bitmap_filename(name)), 'rb') as f:
+            return int.from_bytes(f.read(), 'little')
+
+    def _created_window(self, since, until):
+        """Positions of posts with since <= created_utc < until, oldest first."""
+        keys = self._array(CREATED_KEYS_FILENAME, 'd')
+        lo = 0 if since is None else bisect_left(keys, since)
+        hi = len(keys) if until is None else bisect_left(keys, until)
+        return self._order('old')[lo:max(lo, hi)]
+
+    def select(self, sort=None, filters=None, since=None, until=None, offset=0, limit=None):
+        """Return (positions, total) for one page of the feed.
+
+        sort is a key of SORT_KEYS or None for archive order. filters maps names
+        from FILTERS to True (only posts with it) or False (only posts without).
+        since and until bound created_utc; until is exclusive. limit=None
+        returns every matching position from offset on.
+        """
+        full = (1 << self.count) - 1
+        mask = None
+        for name, wanted in (filters or {}).items():
+            bitmap = self._bitmap(name)
+            mask = (full if mask is None else mask) & (bitmap if wanted else ~bitmap)
+
+        if sort is None:
+            order = range(self.count)
+        else:
+            order = self._order(sort)
+
+        if since is not None or until is not None:
+            window = self._created_window(since, until)
+            by_date = SORT_KEYS.get(sort) == 'created_utc'
+            if mask is not None or not by_date:
+                in_window = bytearray((self.count + 7) // 8)
+                for position in window:
+                    in_window[position >> 3] |= 1 << (position & 7)
+                in_window = int.from_bytes(in_window, 'little')
+                mask = in_window if mask is None else mask & in_window
+            if by_date:
+                # Already in date order: the range is a slice of it
+                order = window
+
+        descending = sort in DESCENDING_SORTS
+        if mask is None:
+            total = len(order)
+            stop = total if limit is None else min(total, offset + limit)
+            if offset >= stop:
+                return [], total
+            if descending:
+                return list(reversed(order[total - stop:total - offset])), total
+            return list(order[offset:stop]), total
+
+        bits = mask.to_bytes((self.count + 7) // 8, 'little')
+        total = bin(mask).count('1')
+        positions = []
+        skipped = 0
+        for position in (reversed(order) if descending else order):
+            if not bits[position >> 3] >> (position & 7) & 1:
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            positions.append(position)
+            if limit is not None and len(positions) >= limit:
+                break
+        return positions, total
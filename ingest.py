@@ -0,0 +1,138 @@
+import os
+import json
+import argparse
+import time
+
+from storage import connect, iter_archive_file, POST_COLUMNS, BOOL_COLUMNS, COMMENT_COLUMNS, DB_FILENAME
+
+BATCH_SIZE = 1000
+
+UPSERT_POST = (
+    f"INSERT INTO posts ({', '.join(POST_COLUMNS)}, extra) "
+    f"VALUES ({', '.join('?' * (len(POST_COLUMNS) + 1))}) "
+    f"ON CONFLICT(id) DO UPDATE SET "
+    + ', '.join(f"{column} = excluded.{column}" for column in POST_COLUMNS[1:] + ['extra'])
+)
+UPSERT_COMMENT = (
+    f"INSERT INTO comments (post_id, {', '.join(COMMENT_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * (len(COMMENT_COLUMNS) + 1))}) "
+    f"ON CONFLICT(id) DO UPDATE SET "
+    + ', '.join(f"{column} = excluded.{column}" for column in ['post_id'] + COMMENT_COLUMNS[1:])
+)
+
+
+def find_input_files(input_path):
+    """Return archive.json itself, or every search-result file below a directory."""
+    if os.path.isfile(input_path):
+        return [input_path]
+    files = []
+    for root, _, filenames in os.walk(input_path):
+        for filename in sorted(filenames):
+            if filename.endswith(('.txt', '.json')):
+                files.append(os.path.join(root, filename))
+    return sorted(files)
+
+
+def post_row(post):
+    row = []
+    for column in POST_COLUMNS:
+        value = post.get(column)
+        row.append(int(value) if column in BOOL_COLUMNS and value is not None else value)
+    known = set(POST_COLUMNS) | {'comments', 'local_media'}
+    extra = {key: value for key, value in post.items() if key not in known}
+    row.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+    return row
+
+
+def write_batch(conn, posts):
+    post_ids = [(post['id'],) for post in posts]
+    comment_rows = []
+    media_rows = []
+    for post in posts:
+        for comment in post.get('comments') or []:
+            if comment.get('id'):
+                comment_rows.append([post['id']] + [comment.get(column) for column in COMMENT_COLUMNS])
+        media = post.get('local_media')
+        if isinstance(media, str):
+            media = [media]
+        for position, path in enumerate(media or []):
+            media_rows.append((post['id'], position, path))
+
+    with conn:
+        conn.executemany(UPSERT_POST, [post_row(post) for post in posts])
+        conn.executemany(UPSERT_COMMENT, comment_rows)
+        # Media lists are replaced as a whole so a shorter gallery doesn't leave stale slots
+        conn.executemany('DELETE FROM media WHERE post_id = ?', post_ids)
+        conn.executemany('INSERT INTO media (post_id, position, path) VALUES (?, ?, ?)', media_rows)
+    return len(comment_rows)
+
+
+def ingest(input_path, db_path, batch_size=BATCH_SIZE):
+    """Upsert every post found at input_path into the SQLite database at db_path.
+
+    A post found more than once (search results often are) is taken from the
+    first file it appears in, as 4-merge-and-remove-duplicates.py does. Posts
+    already in the database are replaced, so a re-run picks up newer copies.
+    Returns (posts, comments, duplicates skipped).
+    """
+    conn = connect(db_path)
+    total_posts = 0
+    total_comments = 0
+    seen = set()
+    duplicates = 0
+
+    try:
+        batch = []
+        for filepath in find_input_files(input_path):
+            try:
+                for post in iter_archive_file(filepath):
+                    if not post.get('id'):
+                        continue
+                    if post['id'] in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(post['id'])
+                    batch.append(post)
+                    if len(batch) >= batch_size:
+                        total_comments += write_batch(conn, batch)
+                        total_posts += len(batch)
+                        batch = []
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                print(f"Error reading {filepath}: {e}")
+        if batch:
+            total_comments += write_batch(conn, batch)
+            total_posts += len(batch)
+        conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+
+    return total_posts, total_comments, duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load an archive.json or a search-results folder into a SQLite database')
+    parser.add_argument('-i', '--input', required=True, help='archive.json file or search-results directory')
+    parser.add_argument('-s', '--subreddit', help='Subreddit name; writes to ./r/<subreddit>/archive.db')
+    parser.add_argument('-o', '--output', help='Output database path (overrides --subreddit)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Posts per insert transaction')
+    args = parser.parse_args()
+
+    if args.output:
+        db_path = args.output
+    elif args.subreddit:
+        db_path = os.path.join('r', args.subreddit, DB_FILENAME)
+    else:
+        parser.error('either --subreddit or --output is required')
+
+    if not os.path.exists(args.input):
+        print(f"Error: Input '{args.input}' does not exist")
+        exit(1)
+
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    start_time = time.time()
+    total_posts, total_comments, duplicates = ingest(args.input, db_path, args.batch_size)
+    print(f"Ingested {total_posts} posts and {total_comments} comments into {db_path} "
+          f"({duplicates} duplicate posts skipped) in {time.time() - start_time:.2f} seconds")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import os
+import json
+import stat
+import argparse
+
+from storage import DB_FILENAME, connect
+from archive_index import ensure_index
+from atomic_write import temp_path
+
+# Small per-subreddit summary so listing pages don't have to open every archive.
+# It has two independent parts: "posts" (counts, score, date range) and "media"
+# (bytes on disk, icon and banner). Each part records the stat of the files it
+# was computed from and is recomputed on its own when those change, so the merge
+# script can write the posts part and the media merger the media part.
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+POST_SOURCES = ['archive.json', DB_FILENAME, DB_FILENAME + '-wal']
+MEDIA_SOURCES = ['images', 'videos']
+ICON_FORMATS = ['icon.png', 'icon.jpg', 'icon.jpeg', 'icon.gif', 'icon.webp']
+BANNER_FORMATS = ['banner.png', 'banner.jpg', 'banner.jpeg', 'banner.gif', 'banner.webp']
+
+
+def _stamp(directory, names):
+    stamp = []
+    for name in names:
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except FileNotFoundError:
+            continue
+        # A directory's mtime changes when files are added or removed
+        stamp.append([name, 0 if stat.S_ISDIR(st.st_mode) else st.st_size, st.st_mtime_ns])
+    return stamp
+
+
+def is_subreddit_dir(directory):
+    """Whether directory is an r/<subreddit> folder, the only kind the viewer serves."""
+    return os.path.basename(os.path.dirname(os.path.abspath(directory))) == 'r'
+
+
+def source_stamp(directory):
+    """Stat of everything the manifest is derived from; changes whenever the archive or media do."""
+    return _stamp(directory, POST_SOURCES + MEDIA_SOURCES)
+
+
+def summarize_posts(directory):
+    summary = {
+        'stamp': _stamp(directory, POST_SOURCES),
+        'post_count': 0,
+        'comment_count': 0,
+        'total_score': 0,
+        'first_post_utc': None,
+        'last_post_utc': None
+    }
+
+    db_path = os.path.join(directory, DB_FILENAME)
+    archive_path = os.path.join(directory, 'archive.json')
+    if os.path.exists(db_path):
+        conn = connect(db_path, readonly=True)
+        try:
+            row = conn.execute('SELECT COUNT(*), COALESCE(SUM(score), 0), MIN(created_utc), MAX(created_utc) FROM posts').fetchone()
+            summary['post_count'], summary['total_score'], summary['first_post_utc'], summary['last_post_utc'] = row
+            summary['comment_count'] = conn.execute('SELECT COUNT(*) FROM comments').fetchone()[0]
+        finally:
+            conn.close()
+    elif os.path.exists(archive_path):
+        # Counted by the offset index build, which the viewer needs anyway
+        meta = ensure_index(directory).meta
+        summary['post_count'] = meta['count']
+        for key in ('comment_count', 'total_score', 'first_post_utc', 'last_post_utc'):
+            summary[key] = meta[key]
+    return summary
+
+
+def summarize_media(directory):
+    summary = {
+        'stamp': _stamp(directory, MEDIA_SOURCES),
+        'media_bytes': 0,
+        'image_count': 0,
+        'video_count': 0,
+        'icon': None,
+        'banner': None
+    }
+
+    for folder, counter in (('images', 'image_count'), ('videos', 'video_count')):
+        try:
+            with os.scandir(os.path.join(directory, folder)) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        summary['media_bytes'] += entry.stat().st_size
+                        summary[counter] += 1
+        except FileNotFoundError:
+            continue
+
+    images_dir = os.path.join(directory, 'images')
+    summary['icon'] = next((name for name in ICON_FORMATS if os.path.exists(os.path.join(images_dir, name))), None)
+    summary['banner'] = next((name for name in BANNER_FORMATS if os.path.exists(os.path.join(images_dir, name))), None)
+    return summary
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return {'version': MANIFEST_VERSION}
+
+
+def _save(directory, manifest):
+    # Workers refreshing the same stale manifest each write their own copy
+    path = os.path.join(directory, MANIFEST_FILENAME)
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _refresh(directory, manifest, posts, media):
+    if posts:
+        manifest['posts'] = summarize_posts(directory)
+    if media:
+        manifest['media'] = summarize_media(directory)
+    return manifest
+
+
+def write_manifest(directory, posts=True, media=True):
+    """Recompute the requested parts of the manifest in directory and save it."""
+    manifest = _refresh(directory, read_manifest(directory), posts, media)
+    _save(directory, manifest)
+    return manifest
+
+
+def load_manifest(directory):
+    """Return the manifest for directory, recomputing any part that is missing or stale."""
+    manifest = read_manifest(directory)
+    stale_posts = manifest.get('posts', {}).get('stamp') != _stamp(directory, POST_SOURCES)
+    stale_media = manifest.get('media', {}).get('stamp') != _stamp(directory, MEDIA_SOURCES)
+    if stale_posts or stale_media:
+        manifest = _refresh(directory, manifest, stale_posts, stale_media)
+        try:
+            _save(directory, manifest)
+        except OSError as e:
+            # Read-only archive directory: still serve the fresh summary
+            print(f"Could not write manifest for {directory}: {e}")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write manifest.json summaries for archived subreddits')
+    parser.add_argument('directories', nargs='+', help='Subreddit directories, e.g. ./r/Touhou')
+    args = parser.parse_args()
+
+    for directory in args.directories:
+        manifest = write_manifest(directory)
+        print(f"{directory}: {manifest['posts']['post_count']} posts, "
+              f"{manifest['posts']['comment_count']} comments, "
+              f"{manifest['media']['media_bytes'] / 1024 ** 3:.2f} GB of media")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Counters, gauges and latency histograms shared by the download, extraction and
+# merge scripts and the viewer. A background thread appends a snapshot as one
+# JSON line every few seconds (counters also as per-second rates since the last
+# line), and the same numbers can be scraped in Prometheus text format.
+#
+# Configured from the environment so the interactive scripts need no new prompts:
+#   METRICS_FILE      JSON lines output (default: metrics.jsonl, empty to disable)
+#   METRICS_INTERVAL  seconds between lines (default: 10)
+#   METRICS_PORT      serve /metrics on 127.0.0.1:<port> (default: off)
+DEFAULT_FILE = 'metrics.jsonl'
+DEFAULT_INTERVAL = 10
+# Upper bounds in seconds; wide enough for both page renders and slow media downloads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def series_key(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99)
+        }
+
+
+class Metrics:
+    """Thread-safe registry of named series, each optionally split by labels."""
+
+    def __init__(self, stage=None):
+        self.stage = stage
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._reporter = None
+        self._path = None
+        self._stop = threading.Event()
+        self._last_counters = {}
+        self._last_time = time.time()
+
+    def inc(self, name, value=1, **labels):
+        key = series_key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[series_key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = series_key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe how long the with-block took into the histogram name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Current values as one JSON-serializable dict, with counter rates since the last call."""
+        now = time.time()
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: histogram.summary() for key, histogram in self.histograms.items()}
+        elapsed = max(now - self._last_time, 1e-9)
+        rates = {key: round((value - self._last_counters.get(key, 0)) / elapsed, 3)
+                 for key, value in counters.items()}
+        self._last_counters, self._last_time = counters, now
+        return {
+            'time': round(now, 3),
+            'stage': self.stage,
+            'counters': counters,
+            'rates': rates,
+            'gauges': gauges,
+            'histograms': histograms
+        }
+
+    def prometheus(self):
+        """All series in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((key, list(h.counts), h.count, h.sum, h.buckets) for key, h in self.histograms.items())
+
+        lines = []
+        typed = set()
+
+        def declare(key, kind):
+            name = key.split('{', 1)[0]
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            return name
+
+        for key, value in counters:
+            declare(key, 'counter')
+            lines.append(f"{key} {value}")
+        for key, value in gauges:
+            declare(key, 'gauge')
+            lines.append(f"{key} {value}")
+        for key, counts, count, total, buckets in histograms:
+            name = declare(key, 'histogram')
+            labels = key[len(name) + 1:-1] if '{' in key else ''
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                bucket_labels = ','.join(filter(None, [labels, f'le="{bound}"']))
+                lines.append(f"{name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f"{{{labels}}}" if labels else ''
+            lines.append(f"{name}_sum{suffix} {total}")
+            lines.append(f"{name}_count{suffix} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_line(self, path):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.snapshot()) + '\n')
+
+    def start_reporter(self, path, interval=DEFAULT_INTERVAL):
+        """Append a snapshot to path every interval seconds from a daemon thread."""
+        def report():
+            while not self._stop.wait(interval):
+                try:
+                    self.write_line(path)
+                except OSError as e:
+                    print(f"Could not write metrics to {path}: {e}")
+
+        self._path = path
+        self._reporter = threading.Thread(target=report, name='metrics-reporter', daemon=True)
+        self._reporter.start()
+
+    def serve(self, port):
+        """Serve /metrics in Prometheus text format on 127.0.0.1:port from a daemon thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        print(f"Metrics available at http://127.0.0.1:{port}/metrics")
+        return server
+
+    def close(self):
+        """Stop the reporter and write a final line, so short runs are recorded too."""
+        if self._reporter is not None:
+            self._stop.set()
+            self._reporter.join()
+            self._reporter = None
+            try:
+                self.write_line(self._path)
+            except OSError as e:
+                print(f"Could not write metrics to {self._path}: {e}")
+
+
+metrics = Metrics()
+
+
+def configure(stage, serve=True):
+    """Name this process's stage and start the outputs selected by the METRICS_* variables.
+
+    serve=False skips METRICS_PORT, for processes that expose /metrics themselves.
+    """
+    metrics.stage = stage
+    path = os.environ.get('METRICS_FILE', DEFAULT_FILE)
+    if path:
+        metrics.start_reporter(path, float(os.environ.get('METRICS_INTERVAL', DEFAULT_INTERVAL)))
+    port = os.environ.get('METRICS_PORT')
+    if serve and port:
+        metrics.serve(int(port))
+    return metrics
+
+
+_last_used = None
+
+
+def record_rate_limits(reddit):
+    """Record the API quota PRAW reports after its last request, and count requests from it."""
+    global _last_used
+    limits = reddit.auth.limits
+    for key in ('remaining', 'used', 'reset_timestamp'):
+        if limits.get(key) is not None:
+            metrics.set(f'reddit_ratelimit_{key}', limits[key])
+
+    # 'used' counts requests in the current rate-limit window and restarts with each window
+    used = limits.get('used')
+    if used is not None:
+        metrics.inc('reddit_requests_total', used - _last_used if _last_used is not None and used >= _last_used else used)
+        _last_used = used
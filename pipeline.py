@@ -0,0 +1,397 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import importlib.util
+from pathlib import Path
+
+from manifest import write_manifest, is_subreddit_dir
+from storage import iter_archive_file
+from metrics import metrics, configure
+from atomic_write import JsonListWriter
+
+# Runs the whole archiving flow without prompts, every stage at the same time,
+# each handing its results to the next through a queue:
+#
+#   download hot posts ──> extract terms ──> terms ──> search ──> merge into archive.json
+#          │                   terms_file ───┘           └──────> move media, remove duplicates
+#          └────────────────────────────────────────────────────> merge
+#
+# Searching starts with the first terms found, and each term's results are
+# merged and its media moved while the other terms are still being searched.
+# The stages are the functions of the numbered scripts; their settings come from
+# a JSON config file (see pipeline.example.json) instead of their constants.
+DEFAULT_CONFIG = {
+    'subreddit': None,
+    'reddit': {
+        'client_id': 'Put your Client ID here',
+        'secret': 'Put your Secret here',
+        'user_agent': 'SubredditArchiver/1.0'
+    },
+    'post_limit': 1000,
+    'comment_limit': 500,
+    # Download the subreddit's hot posts, as download_media.py does, and extract search terms from them
+    'hot_posts': True,
+    'extract_terms': True,
+    # Also search the terms in this file, one per line
+    'terms_file': None,
+    # Every term searched is written here (default: <subreddit>_terms.txt, false to skip)
+    'terms_output': None,
+    # Folder of the finished archive (default: r/<subreddit>)
+    'output': None,
+    # Keep the posts already in the output archive
+    'keep_existing': True,
+    # Reuse results in ./search-results from earlier runs instead of searching again
+    'skip_searched': True,
+    # Seconds each search worker waits between searches, to be polite to Reddit's API
+    'search_delay': 2,
+    # Threads per stage. Searches share one API quota, so more than a few only adds waiting
+    'workers': {
+        'extract': 1,
+        'search': 2,
+        'media': 1
+    },
+    'status_interval': 10
+}
+SEARCH_RESULTS_DIR = './search-results'
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Sent once by each producer of a stage when it has nothing more to send
+DONE = object()
+# Tells a worker thread to exit
+STOP = object()
+
+
+def load_script(filename):
+    """Import one of the numbered pipeline scripts, whose names aren't valid module names."""
+    spec = importlib.util.spec_from_file_location(filename.split('.')[0].replace('-', '_'), os.path.join(BASE_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_config(path):
+    """Read a config file over DEFAULT_CONFIG. Unknown keys are errors, so typos don't pass silently."""
+    with open(path, 'r', encoding='utf-8') as f:
+        overrides = json.load(f)
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    for key, value in overrides.items():
+        if key not in config:
+            raise ValueError(f"unknown setting '{key}'")
+        if isinstance(config[key], dict):
+            unknown = set(value) - set(config[key])
+            if unknown:
+                raise ValueError(f"unknown setting '{key}.{sorted(unknown)[0]}'")
+            config[key].update(value)
+        else:
+            config[key] = value
+    return config
+
+
+class Stage:
+    """A pool of threads calling handle(item) for every item put in its queue.
+
+    handle returns or yields items for the stages this one feeds; yielded items
+    are passed on as soon as they are produced. A stage stops once every producer
+    has called close() and its queue is empty, then runs finish and closes the
+    stages it feeds.
+    """
+
+    def __init__(self, name, handle, workers=1, finish=None):
+        self.name = name
+        self.handle = handle
+        self.workers = max(1, workers)
+        self.finish = finish
+        self.outputs = []
+        self.handled = 0
+        self.finished = threading.Event()
+        self._queue = queue.Queue()
+        self._producers = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def feeds(self, *stages):
+        for stage in stages:
+            self.outputs.append(stage)
+            stage.add_producer()
+
+    def add_producer(self):
+        self._producers += 1
+
+    def put(self, item):
+        self._queue.put(item)
+        metrics.set('pipeline_queue_depth', self._queue.qsize(), stage=self.name)
+
+    def close(self):
+        self._queue.put(DONE)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def start(self):
+        self._running = self.workers
+        for number in range(self.workers):
+            threading.Thread(target=self._work, name=f"{self.name}-{number}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is STOP:
+                break
+            if item is DONE:
+                with self._lock:
+                    self._producers -= 1
+                    last = self._producers == 0
+                if last:
+                    # Queued after everything the producers sent, so the other workers finish it first
+                    for _ in range(self.workers):
+                        self._queue.put(STOP)
+                continue
+
+            metrics.set('pipeline_queue_depth', self._queue.qsize(), stage=self.name)
+            start = time.perf_counter()
+            try:
+                for result in self.handle(item) or ():
+                    for stage in self.outputs:
+                        stage.put(result)
+            except Exception as e:
+                metrics.inc('pipeline_errors_total', stage=self.name)
+                print(f"Error in {self.name} stage: {e}")
+            metrics.observe('pipeline_item_seconds', time.perf_counter() - start, stage=self.name)
+            metrics.inc('pipeline_items_total', stage=self.name)
+            with self._lock:
+                self.handled += 1
+
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            if self.finish is not None:
+                try:
+                    self.finish()
+                except Exception as e:
+                    print(f"Error finishing {self.name} stage: {e}")
+            for stage in self.outputs:
+                stage.close()
+            self.finished.set()
+
+
+class ArchiveWriter(JsonListWriter):
+    """Writes posts to archive.json as they arrive, skipping ids already written.
+
+    The previous archive stays readable until close() swaps in the new one.
+    """
+
+    def __init__(self, archive_path):
+        super().__init__(archive_path)
+        self.ids = set()
+        self.duplicates = 0
+
+    def add(self, post):
+        if post['id'] in self.ids:
+            self.duplicates += 1
+            metrics.inc('merge_duplicate_posts_total')
+            return
+        super().add(post)
+        self.ids.add(post['id'])
+        metrics.inc('merge_posts_total')
+
+
+def build_pipeline(config, subreddit, output):
+    """Create and connect the stages for config. Returns (stages, archive writer)."""
+    search_script = load_script('2-download-from-txt.py')
+    strip_script = load_script('3-strip_txt.py')
+    move_script = load_script('5-merge-search-results-folders.py')
+    dedupe_script = load_script('6-delete-dupes.py')
+    import download_media
+    for module in (download_media, search_script):
+        module.REDDIT_CLIENT_ID = config['reddit']['client_id']
+        module.REDDIT_SECRET = config['reddit']['secret']
+        module.REDDIT_USER_AGENT = config['reddit']['user_agent']
+        module.POST_LIMIT = config['post_limit']
+        module.COMMENT_LIMIT = config['comment_limit']
+
+    stages = []
+
+    # Merge: one writer, in the order results arrive; the first copy of a post wins as in 4-merge
+    writer = ArchiveWriter(os.path.join(output, 'archive.json'))
+
+    def merge(item):
+        if isinstance(item, dict):
+            writer.add(item)
+        else:
+            term, results_path, media_dir = item
+            for post in iter_archive_file(results_path):
+                writer.add(post)
+
+    merge_stage = Stage('merge', merge, finish=writer.close)
+
+    # Media: move each term's folder into the archive, removing copies of files already there
+    def move_media(item):
+        term, results_path, media_dir = item
+        for moved in move_script.move_media_files(media_dir, output, finish=False):
+            dedupe_script.remove_if_duplicate(Path(moved))
+
+    media_stage = Stage('media', move_media, config['workers']['media'])
+
+    def search(term):
+        results_path = os.path.join(SEARCH_RESULTS_DIR, search_script.sanitize_filename(f"{subreddit}_{term}.txt"))
+        media_dir = search_script.ensure_directories(subreddit, term)
+        if not (config['skip_searched'] and os.path.exists(results_path)):
+            success, post_count = search_script.search_subreddit(subreddit, term)
+            metrics.inc('searches_total', result='ok' if success else 'error')
+            time.sleep(config['search_delay'])
+            if not success:
+                return None
+        return [(term, results_path, media_dir)]
+
+    search_stage = Stage('search', search, config['workers']['search'])
+    search_stage.feeds(merge_stage, media_stage)
+
+    # Terms: drop repeats and terms that extend one already searched, as 3-strip_txt.py does
+    searched = set()
+    terms_output = open(config['terms_output'], 'w', encoding='utf-8') if config['terms_output'] else None
+
+    def filter_term(term):
+        if term in searched or strip_script.extends_kept(term, searched):
+            return None
+        searched.add(term)
+        metrics.set('terms_found', len(searched))
+        if terms_output:
+            terms_output.write(term + '\n')
+            terms_output.flush()
+        return [term]
+
+    terms_stage = Stage('terms', filter_term, finish=terms_output.close if terms_output else None)
+    terms_stage.feeds(search_stage)
+
+    if config['hot_posts']:
+        def download(subreddit_name):
+            reddit = download_media.praw.Reddit(
+                client_id=config['reddit']['client_id'],
+                client_secret=config['reddit']['secret'],
+                user_agent=config['reddit']['user_agent']
+            )
+            return download_media.iter_subreddit_posts(reddit, subreddit_name, output)
+
+        download_stage = Stage('download', download)
+        download_stage.feeds(merge_stage)
+        stages.append(download_stage)
+
+        if config['extract_terms']:
+            extract_script = load_script('1-extract-search-terms.py')
+            ner_model = extract_script.initialize_ner_model()
+
+            def extract(post):
+                # Shortest first, so a term is searched before the longer ones that extend it
+                return sorted(extract_script.extract_post_terms(post, ner_model), key=len)
+
+            extract_stage = Stage('extract', extract, config['workers']['extract'])
+            extract_stage.feeds(terms_stage)
+            download_stage.feeds(extract_stage)
+            stages.append(extract_stage)
+
+    stages += [terms_stage, search_stage, merge_stage, media_stage]
+    return stages, writer
+
+
+def print_status(stages, start_time):
+    parts = [f"{stage.name} {stage.handled}" + (f" ({stage.pending()} queued)" if stage.pending() else '')
+             for stage in stages]
+    print(f"[{time.time() - start_time:.0f}s] " + ' | '.join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive a subreddit in one run: download, extract terms, search, merge and deduplicate')
+    parser.add_argument('-c', '--config', required=True, help='JSON config file (see pipeline.example.json)')
+    parser.add_argument('-s', '--subreddit', help='Subreddit to archive (overrides the config file)')
+    args = parser.parse_args()
+
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        print(f"Error reading config file {args.config}: {e}")
+        exit(1)
+
+    subreddit = (args.subreddit or config['subreddit'] or '').strip().lower()
+    if not subreddit:
+        print("Subreddit name is required (set 'subreddit' in the config file or pass -s).")
+        exit(1)
+    terms = []
+    if config['terms_file']:
+        if not os.path.isfile(config['terms_file']):
+            print(f"Error: File not found - {config['terms_file']}")
+            exit(1)
+        with open(config['terms_file'], 'r', encoding='utf-8') as f:
+            terms = [line.strip() for line in f if line.strip()]
+    if config['terms_output'] is None:
+        config['terms_output'] = f"{subreddit}_terms.txt"
+    # The output is truncated when the pipeline starts, so it can't also be the input
+    if (config['terms_output'] and config['terms_file'] and os.path.exists(config['terms_output'])
+            and os.path.samefile(config['terms_output'], config['terms_file'])):
+        print(f"Error: 'terms_output' and 'terms_file' are the same file - {config['terms_file']}")
+        exit(1)
+    if not terms and not (config['hot_posts'] and config['extract_terms']):
+        print("Nothing to search: set 'terms_file', or enable both 'hot_posts' and 'extract_terms'.")
+        exit(1)
+
+    output = config['output'] or os.path.join('r', subreddit)
+    for folder in ('images', 'videos'):
+        os.makedirs(os.path.join(output, folder), exist_ok=True)
+    archive_path = os.path.join(output, 'archive.json')
+    configure('pipeline')
+    start_time = time.time()
+
+    try:
+        stages, writer = build_pipeline(config, subreddit, output)
+    except Exception as e:
+        print(f"Error starting pipeline: {e}")
+        metrics.close()
+        exit(1)
+
+    # This thread is the producer of the first items: the subreddit, the terms file and the existing archive.
+    # It registers before any stage starts, or an upstream stage could close one of them first
+    by_name = {stage.name: stage for stage in stages}
+    download_stage, terms_stage, merge_stage = by_name.get('download'), by_name['terms'], by_name['merge']
+    for stage in (download_stage, terms_stage, merge_stage):
+        if stage is not None:
+            stage.add_producer()
+    for stage in stages:
+        stage.start()
+
+    if download_stage is not None:
+        download_stage.put(subreddit)
+        download_stage.close()
+    # Shortest first, so a term is searched before the longer ones that extend it
+    for term in sorted(terms, key=len):
+        terms_stage.put(term)
+    terms_stage.close()
+    if config['keep_existing'] and os.path.exists(archive_path):
+        merge_stage.put((None, archive_path, None))
+    merge_stage.close()
+
+    print(f"Archiving r/{subreddit} into {output}")
+    try:
+        next_status = time.time() + config['status_interval']
+        while not all(stage.finished.is_set() for stage in stages):
+            time.sleep(0.2)
+            if time.time() >= next_status:
+                print_status(stages, start_time)
+                next_status += config['status_interval']
+    except KeyboardInterrupt:
+        print(f"\nInterrupted. Finished searches are saved in {SEARCH_RESULTS_DIR}; "
+              f"run the pipeline again to continue, or merge them with 4-merge-and-remove-duplicates.py")
+        metrics.close()
+        exit(1)
+
+    if is_subreddit_dir(output):
+        write_manifest(output)
+    print_status(stages, start_time)
+    metrics.close()
+    print(f"Completed in {time.time() - start_time:.2f} seconds: {len(writer.ids)} posts "
+          f"({writer.duplicates} duplicates skipped) in {archive_path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import argparse
+import threading
+from html import escape
+
+from archive_index import index_dir, DIGEST_SIZE
+from storage import open_store
+
+# Full-text index over titles, selftext, comment bodies and authors, kept in a
+# SQLite FTS5 database next to the archive's other index files. It is fed from
+# whichever store serves the subreddit and only re-tokenizes posts that
+# changed. For archive.json that is decided from the digests the offset index
+# keeps of every post, so unchanged posts aren't even decoded.
+SEARCH_FILENAME = 'search.db'
+# How long a process waits for another one (a serve.py worker, a CLI run) to
+# finish updating the same search.db before giving up
+BUSY_TIMEOUT_MS = 60 * 1000
+
+# Column weights for bm25(): title, selftext, comments, author
+RANK_WEIGHTS = (10.0, 3.0, 1.0, 2.0)
+
+# Markers that can't appear in archived text; swapped for <mark> after escaping
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS docs (rowid INTEGER PRIMARY KEY, post_id TEXT UNIQUE NOT NULL, digest BLOB NOT NULL);
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+    title, selftext, comments, author,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# One open SearchIndex per subreddit directory for the life of the process
+_indexes = {}
+_indexes_guard = threading.Lock()
+
+
+def connect(subreddit_dir):
+    out_dir = index_dir(subreddit_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(out_dir, SEARCH_FILENAME), check_same_thread=False)
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    return conn
+
+
+def searchable_text(post):
+    comments = '\n'.join(comment.get('body') or '' for comment in post.get('comments') or [])
+    return post.get('title') or '', post.get('selftext') or '', comments, post.get('author') or ''
+
+
+def update_search_index(conn, store, if_stale=False):
+    """Bring the FTS index in line with the store; returns (added, updated, removed).
+
+    The update is one write transaction, so a process that was waiting for
+    another one to finish sees its result; with if_stale it then does nothing.
+    """
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if if_stale and _is_current(conn, store):
+            conn.rollback()
+            return 0, 0, 0
+        counts = _sync_docs(conn, store)
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('stamp', json.dumps(store.stamp())))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return counts
+
+
+def _sync_docs(conn, store):
+    # Read inside the write transaction so no other process changes docs meanwhile
+    known = {post_id: (rowid, digest)
+             for rowid, post_id, digest in conn.execute('SELECT rowid, post_id, digest FROM docs')}
+    seen = set()
+    added = updated = 0
+
+    for post, digest in _posts_to_check(store, known, seen):
+        post_id = post.get('id')
+        if not post_id or post_id in seen:
+            continue
+        seen.add(post_id)
+
+        fields = searchable_text(post)
+        if digest is None:
+            digest = hashlib.blake2b('\0'.join(fields).encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+        existing = known.get(post_id)
+        if existing and existing[1] == digest:
+            continue
+
+        if existing:
+            rowid = existing[0]
+            conn.execute('DELETE FROM posts_fts WHERE rowid = ?', (rowid,))
+            conn.execute('UPDATE docs SET digest = ? WHERE rowid = ?', (digest, rowid))
+            updated += 1
+        else:
+            rowid = conn.execute('INSERT INTO docs (post_id, digest) VALUES (?, ?)', (post_id, digest)).lastrowid
+            added += 1
+        conn.execute('INSERT INTO posts_fts (rowid, title, selftext, comments, author) VALUES (?, ?, ?, ?, ?)',
+                     (rowid, *fields))
+
+    removed = [(rowid,) for post_id, (rowid, _) in known.items() if post_id not in seen]
+    conn.executemany('DELETE FROM posts_fts WHERE rowid = ?', removed)
+    conn.executemany('DELETE FROM docs WHERE rowid = ?', removed)
+    return added, updated, len(removed)
+
+
+def _posts_to_check(store, known, seen):
+    """Yield (post, digest) for every post that may differ from the indexed one.
+
+    A JSON store keeps a digest of each post's record: posts whose digest is
+    already indexed are only added to seen, without being read. Other stores
+    yield every post with digest None, and the post's text is hashed instead.
+    """
+    digests = store.record_digests()
+    if digests is None:
+        for post in store.iter_posts():
+            yield post, None
+        return
+    # One read, rather than one per post where the file isn't mapped
+    digests = digests[:]
+    indexed = {digest: post_id for post_id, (_, digest) in known.items()}
+    for position in range(len(digests) // DIGEST_SIZE):
+        digest = digests[position * DIGEST_SIZE:(position + 1) * DIGEST_SIZE]
+        post_id = indexed.get(digest)
+        if post_id is not None:
+            seen.add(post_id)
+        else:
+            yield store.get_at(position), digest
+
+
+def _is_current(conn, store):
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'stamp'").fetchone()
+    except sqlite3.OperationalError:
+        # Not built yet
+        return False
+    return row is not None and json.loads(row[0]) == store.stamp()
+
+
+def _is_built(conn):
+    try:
+        return conn.execute("SELECT 1 FROM meta WHERE key = 'stamp'").fetchone() is not None
+    except sqlite3.OperationalError:
+        return False
+
+
+def open_search_index(subreddit_dir):
+    with _indexes_guard:
+        search_index = _indexes.get(subreddit_dir)
+        if search_index is None:
+            search_index = _indexes[subreddit_dir] = SearchIndex(subreddit_dir, connect(subreddit_dir))
+    return search_index
+
+
+def ensure_search_index(subreddit_dir, store):
+    """Return the SearchIndex for subreddit_dir, updating it first if the archive changed."""
+    search_index = open_search_index(subreddit_dir)
+    if not _is_current(search_index.conn, store):
+        with search_index.lock:
+            update_search_index(search_index.conn, store, if_stale=True)
+    return search_index
+
+
+def refresh_search_index(subreddit_dir, store):
+    """Return (SearchIndex, current) for a request that shouldn't wait on an update.
+
+    Only an index that was never built is built before returning. One that is
+    behind the archive is updated in a background thread and searched as it
+    was last committed meanwhile; current is False until the update is done.
+    """
+    search_index = open_search_index(subreddit_dir)
+    if _is_current(search_index.conn, store):
+        return search_index, True
+    if not _is_built(search_index.conn):
+        return ensure_search_index(subreddit_dir, store), True
+    search_index.update_in_background(store)
+    return search_index, False
+
+
+def to_match_query(query):
+    """Turn free text into an FTS5 query that ANDs the words, matching the last as a prefix."""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight_html(text):
+    return escape(text).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+
+class SearchIndex:
+    def __init__(self, subreddit_dir, conn):
+        self.subreddit_dir = subreddit_dir
+        self.conn = conn
+        # Held by the thread updating the index; the others wait for it
+        self.lock = threading.Lock()
+
+    def update_in_background(self, store):
+        """Update the index from store in a thread of its own, unless one is already updating it."""
+        if self.lock.acquire(blocking=False):
+            threading.Thread(target=self._update, args=(store,), daemon=True).start()
+
+    def _update(self, store):
+        # A connection of its own, so searches meanwhile read the last committed index
+        conn = connect(self.subreddit_dir)
+        try:
+            update_search_index(conn, store, if_stale=True)
+        except Exception as e:
+            print(f"Error updating the search index of {self.subreddit_dir}: {e}")
+        finally:
+            conn.close()
+            self.lock.release()
+
+    def close(self):
+        """Close the connection; the next ensure_search_index opens a new one."""
+        with _indexes_guard:
+            if _indexes.get(self.subreddit_dir) is self:
+                del _indexes[self.subreddit_dir]
+        self.conn.close()
+
+    def search(self, query, offset, limit):
+        """Return (hits, total) for the ranked matches at offset..offset+limit.
+
+        Each hit is a dict with the post id and HTML-escaped title and snippet
+        with the matched words wrapped in <mark>.
+        """
+        match = to_match_query(query)
+        if match is None:
+            return [], 0
+
+        total = self.conn.execute('SELECT COUNT(*) FROM posts_fts WHERE posts_fts MATCH ?', (match,)).fetchone()[0]
+        rows = self.conn.execute(
+            f"""SELECT docs.post_id,
+                       highlight(posts_fts, 0, ?, ?),
+                       snippet(posts_fts, -1, ?, ?, '…', 24)
+                FROM posts_fts JOIN docs ON docs.rowid = posts_fts.rowid
+                WHERE posts_fts MATCH ?
+                ORDER BY bm25(posts_fts, {', '.join(map(str, RANK_WEIGHTS))})
+                LIMIT ? OFFSET ?""",
+            (HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END, match, limit, offset)
+        ).fetchall()
+
+        hits = [{
+            'id': post_id,
+            'title': highlight_html(title),
+            'snippet': highlight_html(snippet)
+        } for post_id, title, snippet in rows]
+        return hits, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or update the full-text search index for archived subreddits')
+    parser.add_argument('directories', nargs='+', help='Subreddit directories, e.g. ./r/Touhou')
+    args = parser.parse_args()
+
+    for directory in args.directories:
+        store = open_store(directory)
+        if store is None:
+            print(f"Skipping {directory}: no archive")
+            continue
+        conn = connect(directory)
+        try:
+            added, updated, removed = update_search_index(conn, store)
+        finally:
+            conn.close()
+        print(f"{directory}: {added} added, {updated} updated, {removed} removed")
+
+if __name__ == '__main__':
+    main()
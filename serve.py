@@ -0,0 +1,101 @@
+import os
+import time
+import argparse
+
+from app import app, ARCHIVES_DIR, get_available_subreddits
+from storage import open_store
+from search_index import ensure_search_index
+from manifest import load_manifest
+from metrics import configure
+
+# Production entry point for the viewer. Everything a worker reads per request
+# (offset and id tables, sort orders, the archive itself, archive.db) is a file
+# that workers map read-only, so the OS keeps one copy in its page cache however
+# many workers there are. The warm-up builds any missing or stale index before
+# the workers start. An archive that changes while they run is reindexed by the
+# first worker to notice; the others wait on the index's lock file and then
+# load the result. Its search database is brought up to date in the background,
+# and searches answer from the previous version meanwhile.
+DEFAULT_BIND = '127.0.0.1:5000'
+DEFAULT_THREADS = 4
+
+
+def warm_up(subreddits=None):
+    """Build and load the indexes, search databases and manifests of every subreddit."""
+    for subreddit in subreddits or get_available_subreddits():
+        subreddit_dir = os.path.join(ARCHIVES_DIR, subreddit)
+        start_time = time.time()
+        store = open_store(subreddit_dir)
+        if store is None:
+            continue
+        try:
+            store.warm()
+            ensure_search_index(subreddit_dir, store).close()
+            load_manifest(subreddit_dir)
+            print(f"Warmed up r/{subreddit}: {store.count()} posts in {time.time() - start_time:.2f} seconds")
+        finally:
+            # SQLite connections must not be inherited by forked workers
+            store.close()
+
+
+def serve_gunicorn(bind, workers, threads):
+    from gunicorn.app.base import BaseApplication
+
+    class ArchiveServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', bind)
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread' if threads > 1 else 'sync')
+            # Each worker keeps its own counters; /metrics shows the worker that answered
+            self.cfg.set('post_fork', lambda server, worker: configure(f'viewer-{worker.pid}', serve=False))
+
+        def load(self):
+            return app
+
+    ArchiveServer().run()
+
+
+def serve_waitress(bind, threads):
+    from waitress import serve
+    serve(app, listen=bind, threads=threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the archive viewer with multiple workers')
+    parser.add_argument('-b', '--bind', default=DEFAULT_BIND, help=f'Address to listen on (default: {DEFAULT_BIND})')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (default: CPU count)')
+    parser.add_argument('-t', '--threads', type=int, default=DEFAULT_THREADS, help=f'Threads per worker (default: {DEFAULT_THREADS})')
+    parser.add_argument('--no-warmup', action='store_true', help='Skip building and loading indexes before serving')
+    args = parser.parse_args()
+
+    if not args.no_warmup:
+        warm_up()
+
+    # gunicorn forks workers and doesn't run on Windows; waitress is one process with a thread pool
+    try:
+        import gunicorn
+        if os.name != 'nt':
+            print(f"Serving on http://{args.bind} with {args.workers} workers x {args.threads} threads")
+            serve_gunicorn(args.bind, args.workers, args.threads)
+            return
+    except ImportError:
+        pass
+
+    configure('viewer', serve=False)
+
+    try:
+        import waitress
+        print(f"Serving on http://{args.bind} with waitress, {args.threads} threads (--workers needs gunicorn)")
+        serve_waitress(args.bind, args.threads)
+        return
+    except ImportError:
+        pass
+
+    print("Neither gunicorn nor waitress is installed (pip install gunicorn or pip install waitress); "
+          "falling back to Flask's threaded development server")
+    host, _, port = args.bind.rpartition(':')
+    app.run(host=host or '127.0.0.1', port=int(port), threaded=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,405 @@
+import os
+import json
+import mmap
+import bisect
+import sqlite3
+
+from archive_index import ensure_index, scan_records
+
+# A subreddit directory is served from archive.db when ingest.py has created one,
+# otherwise straight from archive.json through its offset index. Both stores
+# return posts in the same shape as the entries of archive.json.
+DB_FILENAME = 'archive.db'
+# Upper bound for read-only connections; SQLite caps it at its compile-time maximum
+MMAP_SIZE = 2 * 1024 ** 3
+
+POST_COLUMNS = ['id', 'title', 'author', 'score', 'created_utc', 'num_comments',
+                'permalink', 'url', 'selftext', 'is_self', 'over_18', 'is_gallery',
+                'saved_at', 'search_query']
+BOOL_COLUMNS = {'is_self', 'over_18', 'is_gallery'}
+COMMENT_COLUMNS = ['id', 'author', 'body', 'score', 'created_utc']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    author TEXT,
+    score INTEGER,
+    created_utc REAL,
+    num_comments INTEGER,
+    permalink TEXT,
+    url TEXT,
+    selftext TEXT,
+    is_self INTEGER,
+    over_18 INTEGER,
+    is_gallery INTEGER,
+    saved_at REAL,
+    search_query TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS comments (
+    id TEXT PRIMARY KEY,
+    post_id TEXT NOT NULL,
+    author TEXT,
+    body TEXT,
+    score INTEGER,
+    created_utc REAL
+);
+CREATE TABLE IF NOT EXISTS media (
+    post_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (post_id, position)
+);
+CREATE INDEX IF NOT EXISTS posts_created_utc ON posts(created_utc);
+CREATE INDEX IF NOT EXISTS posts_score ON posts(score);
+CREATE INDEX IF NOT EXISTS posts_num_comments ON posts(num_comments);
+CREATE INDEX IF NOT EXISTS posts_author ON posts(author);
+CREATE INDEX IF NOT EXISTS comments_post_id ON comments(post_id);
+"""
+
+# Feed sorts and filters (see feed_index.py) as SQL; ties go the same way as the JSON store
+FEED_ORDER = {
+    None: 'rowid',
+    'top': 'score DESC, rowid DESC',
+    'new': 'created_utc DESC, rowid DESC',
+    'old': 'created_utc, rowid',
+    'comments': 'num_comments DESC, rowid DESC'
+}
+# Sort column of each order and whether it descends, for keyset pagination; rowid breaks ties
+FEED_KEYSET = {
+    None: (None, False),
+    'top': ('score', True),
+    'new': ('created_utc', True),
+    'old': ('created_utc', False),
+    'comments': ('num_comments', True)
+}
+# Keyset bookmarks kept per store: how many feeds (sort and filters), and positions in each
+MAX_BOOKMARKED_FEEDS = 64
+MAX_BOOKMARKS_PER_FEED = 4096
+FEED_FILTERS = {
+    'media': 'EXISTS (SELECT 1 FROM media WHERE media.post_id = posts.id)',
+    'gallery': 'COALESCE(is_gallery, 0) = 1',
+    'video': ("(EXISTS (SELECT 1 FROM media WHERE media.post_id = posts.id AND (path LIKE '%.mp4' OR path LIKE '%.webm'))"
+              " OR COALESCE(json_extract(extra, '$.is_video'), 0) = 1)"),
+    'nsfw': 'COALESCE(over_18, 0) = 1'
+}
+
+
+def connect(db_path, readonly=False):
+    if readonly:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        # Read pages through a shared mapping instead of a private cache per connection
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    else:
+        conn = sqlite3.connect(db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def open_store(subreddit_dir):
+    """Return the store for a subreddit directory, or None if it has no archive."""
+    db_path = os.path.join(subreddit_dir, DB_FILENAME)
+    if os.path.exists(db_path):
+        return SqliteArchiveStore(db_path)
+    index = ensure_index(subreddit_dir)
+    if index is not None:
+        return JsonArchiveStore(index)
+    return None
+
+
+def store_stamp(subreddit_dir):
+    """Value that changes whenever open_store would open a different store.
+
+    An open archive.db connection sees later writes by itself, so only a replaced
+    database counts; archive.json is reindexed whenever it is rewritten.
+    """
+    for name in (DB_FILENAME, 'archive.json'):
+        try:
+            st = os.stat(os.path.join(subreddit_dir, name))
+        except FileNotFoundError:
+            continue
+        if name == DB_FILENAME:
+            return [name, st.st_dev, st.st_ino]
+        return [name, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns]
+    return None
+
+
+def iter_archive_file(path):
+    """Yield the posts of a JSON array file one at a time without parsing it whole."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for offset, length in scan_records(buf):
+                yield json.loads(buf[offset:offset + length])
+
+
+class JsonArchiveStore:
+    """Posts read from archive.json through its offset and id index."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def count(self):
+        return len(self.index)
+
+    def total_score(self):
+        return self.index.total_score
+
+    def page(self, offset, limit):
+        return self.index.read_range(offset, offset + limit)
+
+    def get_at(self, position):
+        return self.index.read(position) if position >= 0 else None
+
+    def get(self, post_id):
+        return self.index.read_id(post_id)
+
+    def iter_posts(self, start=0, stop=None):
+        if start == 0 and stop is None:
+            return iter_archive_file(self.index.archive_path)
+        return self.index.iter_range(start, len(self.index) if stop is None else stop)
+
+    def query(self, sort=None, filters=None, since=None, until=None, offset=0, limit=None, raw=False):
+        """Return (posts, total) for a sorted and filtered feed; see FeedIndex.select.
+
+        raw=True yields each post as its undecoded JSON bytes, for callers that
+        would only encode it again.
+        """
+        if not (sort or filters or since is not None or until is not None):
+            total = self.count()
+            stop = total if limit is None else min(total, offset + limit)
+            if raw:
+                return self._iter_positions(range(offset, stop), raw), total
+            return self.iter_posts(offset, stop), total
+        positions, total = self.index.feed.select(sort, filters, since, until, offset, limit)
+        return self._iter_positions(positions, raw), total
+
+    def _iter_positions(self, positions, raw, chunk_size=256):
+        # Offsets are looked up a chunk at a time rather than one post per call
+        for start in range(0, len(positions), chunk_size):
+            records = self.index.read_raw(positions[start:start + chunk_size])
+            yield from (records if raw else map(json.loads, records))
+
+    def record_digests(self):
+        """Digests of every post's JSON, DIGEST_SIZE bytes each in list order (see archive_index.py)."""
+        return self.index.digests
+
+    def warm(self):
+        self.index.warm()
+
+    def close(self):
+        pass
+
+    def stamp(self):
+        """Value that changes whenever the archive contents change."""
+        return [self.index.meta['archive_size'], self.index.meta['archive_mtime_ns']]
+
+
+class SqliteArchiveStore:
+    """Posts read from an archive.db written by ingest.py."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = connect(db_path, readonly=True)
+        # Aggregates and keyset bookmarks, both dropped when the database changes
+        self._data_version = None
+        self._totals = {}
+        self._bookmarks = {}
+
+    def count(self):
+        return self._total('SELECT COUNT(*) FROM posts')
+
+    def total_score(self):
+        return self._total('SELECT COALESCE(SUM(score), 0) FROM posts')
+
+    def _total(self, sql, params=()):
+        """Single-value query, cached until another connection commits a change."""
+        version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if version != self._data_version:
+            self._totals = {}
+            self._bookmarks = {}
+            self._data_version = version
+        key = (sql, tuple(params))
+        if key not in self._totals:
+            self._totals[key] = self.conn.execute(sql, params).fetchone()[0]
+        return self._totals[key]
+
+    def page(self, offset, limit):
+        rows = self.conn.execute('SELECT * FROM posts ORDER BY rowid LIMIT ? OFFSET ?',
+                                 (limit, offset)).fetchall()
+        return self._to_posts(rows)
+
+    def get_at(self, position):
+        posts = self.page(position, 1) if position >= 0 else []
+        return posts[0] if posts else None
+
+    def get(self, post_id):
+        rows = self.conn.execute('SELECT * FROM posts WHERE id = ?', (post_id,)).fetchall()
+        posts = self._to_posts(rows)
+        return posts[0] if posts else None
+
+    def iter_posts(self, start=0, stop=None, batch_size=500):
+        first = self.conn.execute('SELECT rowid FROM posts ORDER BY rowid LIMIT 1 OFFSET ?', (start,)).fetchone()
+        if first is None:
+            return
+        last_rowid = first[0] - 1
+        remaining = None if stop is None else stop - start
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            rows = self.conn.execute('SELECT rowid, * FROM posts WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                                     (last_rowid, size)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1]['rowid']
+            if remaining is not None:
+                remaining -= len(rows)
+            yield from self._to_posts(rows)
+
+    def query(self, sort=None, filters=None, since=None, until=None, offset=0, limit=None, raw=False):
+        """Return (posts, total) for a sorted and filtered feed; see FeedIndex.select.
+
+        Rows are always decoded, so raw is ignored.
+        """
+        where = []
+        params = []
+        for name, wanted in (filters or {}).items():
+            clause = FEED_FILTERS[name]
+            where.append(clause if wanted else f'NOT ({clause})')
+        if since is not None:
+            where.append('created_utc >= ?')
+            params.append(since)
+        if until is not None:
+            where.append('created_utc < ?')
+            params.append(until)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ''
+        total = self._total(f'SELECT COUNT(*) FROM posts {where_sql}', params)
+
+        # Pages are read by seeking past the last row of an earlier page of the same
+        # feed instead of stepping over every row before offset
+        column, descending = FEED_KEYSET[sort]
+        feed_key = (sort, where_sql, tuple(params))
+        bookmarks = self._bookmarks
+        skip = offset
+        select_sql = f'SELECT rowid, * FROM posts {where_sql}'
+        select_params = params
+        mark = find_bookmark(bookmarks, feed_key, offset)
+        if mark is not None:
+            position, value, rowid = mark
+            skip = offset - position
+            op = '<' if descending else '>'
+            if column is None:
+                seeks = [('rowid > ?', [rowid])]
+            else:
+                # SQLite only seeks an index on the first term of a row value, so the
+                # rest of the tie and the rows past it are separate index searches
+                seeks = [(f'{column} = ? AND rowid {op} ?', [value, rowid]), (f'{column} {op} ?', [value])]
+            select_sql = ' UNION ALL '.join(f"SELECT rowid, * FROM posts WHERE {' AND '.join(where + [seek])}"
+                                            for seek, _ in seeks)
+            select_params = [param for _, seek_params in seeks for param in params + seek_params]
+
+        cursor = self.conn.execute(f'{select_sql} ORDER BY {FEED_ORDER[sort]} LIMIT ? OFFSET ?',
+                                   select_params + [-1 if limit is None else limit, skip])
+        # Comparisons with NULL are never true, so a column with NULLs is never seeked on
+        if limit is None or (column is not None and self._total(f'SELECT EXISTS (SELECT 1 FROM posts WHERE {column} IS NULL)')):
+            bookmark = None
+        else:
+            bookmark = lambda count, row: add_bookmark(bookmarks, feed_key, offset + count,
+                                                       row[column] if column else None, row['rowid'])
+        return self._iter_cursor(cursor, bookmark), total
+
+    def _iter_cursor(self, cursor, bookmark=None, batch_size=500):
+        count = 0
+        last = None
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            count += len(rows)
+            last = rows[-1]
+            yield from self._to_posts(rows)
+        if bookmark is not None and last is not None:
+            bookmark(count, last)
+
+    def record_digests(self):
+        # Rows aren't stored as one encoded record, so there is nothing cheap to compare
+        return None
+
+    def warm(self):
+        # Touch every table and index once so their pages are in the shared cache
+        for table in ('posts', 'comments', 'media'):
+            self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()
+
+    def close(self):
+        self.conn.close()
+
+    def stamp(self):
+        """Value that changes whenever the database contents change."""
+        stamp = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                st = os.stat(path)
+                stamp += [st.st_size, st.st_mtime_ns]
+            except FileNotFoundError:
+                stamp += [0, 0]
+        return stamp
+
+    def _to_posts(self, rows):
+        if not rows:
+            return []
+        ids = [row['id'] for row in rows]
+        placeholders = ','.join('?' * len(ids))
+
+        comments = {post_id: [] for post_id in ids}
+        for row in self.conn.execute(f'SELECT * FROM comments WHERE post_id IN ({placeholders}) ORDER BY rowid', ids):
+            comments[row['post_id']].append({column: row[column] for column in COMMENT_COLUMNS})
+
+        media = {}
+        for row in self.conn.execute(f'SELECT post_id, path FROM media WHERE post_id IN ({placeholders}) ORDER BY post_id, position', ids):
+            media.setdefault(row['post_id'], []).append(row['path'])
+
+        return [row_to_post(row, comments[row['id']], media.get(row['id'])) for row in rows]
+
+
+def find_bookmark(bookmarks, feed_key, offset):
+    """Return (position, sort value, rowid) of the closest bookmark at or before offset, or None."""
+    marks = bookmarks.get(feed_key)
+    if not marks:
+        return None
+    positions, keys = marks
+    i = bisect.bisect_right(positions, offset) - 1
+    if i < 0:
+        return None
+    return (positions[i],) + keys[positions[i]]
+
+
+def add_bookmark(bookmarks, feed_key, position, value, rowid):
+    marks = bookmarks.get(feed_key)
+    if marks is None:
+        if len(bookmarks) >= MAX_BOOKMARKED_FEEDS:
+            return
+        marks = bookmarks[feed_key] = ([], {})
+    positions, keys = marks
+    if position in keys or len(positions) >= MAX_BOOKMARKS_PER_FEED:
+        return
+    bisect.insort(positions, position)
+    keys[position] = (value, rowid)
+
+
+def row_to_post(row, comments, media):
+    post = {}
+    for column in POST_COLUMNS:
+        value = row[column]
+        if value is None:
+            continue
+        post[column] = bool(value) if column in BOOL_COLUMNS else value
+    if row['extra']:
+        post.update(json.loads(row['extra']))
+    if media:
+        post['local_media'] = media if post.get('is_gallery') else media[0]
+    post['comments'] = comments
+    return post
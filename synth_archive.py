@@ -0,0 +1,273 @@
+import os
+import math
+import time
+import zlib
+import random
+import struct
+import argparse
+from array import array
+from itertools import accumulate
+from datetime import datetime, timezone
+
+from atomic_write import write_json_list
+
+# Generates fake subreddits in the shapes the real scripts write, for benchmarks
+# (bench_pipeline.py) and for trying the viewer without a Reddit account:
+#   <out>/terms.txt                                 search terms, as 1-extract-search-terms.py writes them
+#   <out>/search-results/<sub>_<term>.txt           results per term, as 2-download-from-txt.py writes them
+#   <out>/search-results/media/<sub>/<term>/        images/ and videos/ downloaded for each term
+#   <out>/r/<sub>/archive.json                      the merged archive the viewer reads, with images/ and videos/
+# Every post is derived from the seed and its number, so the same arguments give
+# the same files, and archives of any size are written one post at a time.
+DEFAULT_POSTS = 1000
+DEFAULT_SUBREDDIT = 'synthetic'
+# Comment counts are log-normal: most posts have a few, a few have hundreds
+DEFAULT_COMMENTS_MEDIAN = 5
+COMMENTS_SIGMA = 1.5
+COMMENT_LIMIT = 500
+# Share of posts that more than one search term finds
+DEFAULT_DUPLICATE_RATE = 0.3
+DEFAULT_MEDIA_RATE = 0.4
+DEFAULT_VIDEO_KB = 4
+POSTS_PER_TERM = 20
+# Share of terms that extend another term ("Reimu" and "Reimu Hakurei"), which 3-strip_txt.py removes
+TERM_VARIANT_RATE = 0.35
+VOCABULARY_SIZE = 5000
+SYLLABLES = ['ka', 'ri', 'mo', 'su', 'ne', 'ha', 'to', 'yu', 'mi', 'ra', 'ko', 'shi', 'ta', 'no', 'ma',
+             'ku', 'sa', 'e', 'a', 'o', 'ki', 'ze', 'ro', 'ya', 'chi', 'fu', 'na', 're', 'lu', 'bi']
+FIRST_ID = 36 ** 5
+# Posts are spread over the five years before this date
+END_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+SPAN_SECONDS = 5 * 365 * 24 * 60 * 60
+
+
+def base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    text = ''
+    while number:
+        number, digit = divmod(number, 36)
+        text = digits[digit] + text
+    return text or '0'
+
+
+def png_bytes(width=64, height=64):
+    """A small valid PNG, so thumbnails can be generated from the dummy images."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    # Each row is a filter byte followed by RGB pixels
+    pixels = b''.join(b'\x00' + b''.join(bytes((x * 4, y * 4, 160)) for x in range(width)) for y in range(height))
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(pixels)) +
+            chunk(b'IEND', b''))
+
+
+class Generator:
+    """Deterministic posts, authors and search terms for one fake subreddit."""
+
+    def __init__(self, posts=DEFAULT_POSTS, subreddit=DEFAULT_SUBREDDIT, comments_median=DEFAULT_COMMENTS_MEDIAN,
+                 duplicate_rate=DEFAULT_DUPLICATE_RATE, media_rate=DEFAULT_MEDIA_RATE, terms=None, seed=0):
+        self.posts = posts
+        self.subreddit = subreddit
+        self.comments_median = comments_median
+        self.media_rate = media_rate
+        self.seed = seed
+        rng = random.Random(seed)
+
+        words = set()
+        while len(words) < VOCABULARY_SIZE:
+            words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(1, 4))))
+        self.words = sorted(words)
+        rng.shuffle(self.words)
+        # Word frequencies follow Zipf's law, as in real text
+        self.word_weights = list(accumulate(1 / rank for rank in range(1, len(self.words) + 1)))
+        self.authors = [f"{rng.choice(self.words)}_{rng.choice(self.words)}{rng.randint(1, 99)}"
+                        for _ in range(max(10, posts // 5))]
+        self.author_weights = list(accumulate(1 / rank for rank in range(1, len(self.authors) + 1)))
+
+        self.terms = self._make_terms(rng, terms or max(1, posts // POSTS_PER_TERM))
+        term_weights = list(accumulate(1 / rank for rank in range(1, len(self.terms) + 1)))
+        # The term whose search found each post first, and the posts each term finds
+        self.primary = array('I')
+        self.term_posts = [array('I') for _ in self.terms]
+        for number in range(posts):
+            found = rng.choices(range(len(self.terms)), cum_weights=term_weights)
+            if len(self.terms) > 1 and rng.random() < duplicate_rate:
+                found += rng.sample(range(len(self.terms)), min(len(self.terms), rng.randint(2, 4)))
+            self.primary.append(found[0])
+            for term in dict.fromkeys(found):
+                self.term_posts[term].append(number)
+
+    def _make_terms(self, rng, count):
+        terms = []
+        seen = set()
+        while len(terms) < count:
+            if terms and rng.random() < TERM_VARIANT_RATE:
+                term = f"{rng.choice(terms)} {rng.choice(self.words).title()}"
+            else:
+                term = ' '.join(rng.choice(self.words).title() for _ in range(rng.randint(1, 2)))
+            if term not in seen:
+                seen.add(term)
+                terms.append(term)
+        return terms
+
+    def _text(self, rng, low, high):
+        return ' '.join(rng.choices(self.words, cum_weights=self.word_weights, k=rng.randint(low, high)))
+
+    def _author(self, rng):
+        return rng.choices(self.authors, cum_weights=self.author_weights)[0]
+
+    def post(self, number, media_dir, search_query=None):
+        """Return (post, media) for post number, with media as (folder, filename) pairs under media_dir."""
+        rng = random.Random(self.seed * 1_000_003 + number)
+        post_id = base36(FIRST_ID + number)
+        created = END_TIME - rng.random() * SPAN_SECONDS
+        term = self.terms[self.primary[number]]
+        words = self._text(rng, 3, 12).split(' ')
+        words.insert(rng.randint(0, len(words)), term)
+        title = ' '.join(words).capitalize()
+
+        media = []
+        kind = None
+        if rng.random() < self.media_rate:
+            kind = rng.choices(['image', 'gallery', 'video'], [8, 1, 1])[0]
+            if kind == 'image':
+                media = [('images', f"{post_id}{rng.choice(['.jpg', '.png'])}")]
+            elif kind == 'gallery':
+                media = [('images', f"gallery_{post_id}_{i}.jpg") for i in range(rng.randint(2, 6))]
+            else:
+                media = [('videos', f"{post_id}.mp4")]
+
+        count = 0
+        if self.comments_median > 0:
+            count = min(COMMENT_LIMIT, int(rng.lognormvariate(math.log(self.comments_median), COMMENTS_SIGMA)))
+        comments = [{
+            'id': base36(FIRST_ID * 36 + number * COMMENT_LIMIT + i),
+            'author': self._author(rng),
+            'body': self._text(rng, 3, 40),
+            'score': int(rng.paretovariate(1.2)) - 1,
+            'created_utc': created + rng.random() * 7 * 24 * 60 * 60
+        } for i in range(count)]
+
+        url = f"https://www.reddit.com/r/{self.subreddit}/comments/{post_id}/"
+        if kind == 'image':
+            url = f"https://i.redd.it/{media[0][1]}"
+        elif kind == 'gallery':
+            url = f"https://www.reddit.com/gallery/{post_id}"
+        elif kind == 'video':
+            url = f"https://v.redd.it/{post_id}"
+
+        post = {
+            'id': post_id,
+            'title': title,
+            'author': self._author(rng),
+            'score': int(rng.paretovariate(0.8)) - 1,
+            'created_utc': created,
+            'num_comments': count,
+            'permalink': f"/r/{self.subreddit}/comments/{post_id}/",
+            'url': url,
+            'selftext': self._text(rng, 20, 150) if kind is None and rng.random() < 0.6 else '',
+            'is_self': kind is None,
+            'over_18': rng.random() < 0.05,
+            'saved_at': END_TIME + rng.random() * 24 * 60 * 60
+        }
+        if search_query is not None:
+            post['search_query'] = search_query
+        if media:
+            paths = [os.path.join(media_dir, folder, filename) for folder, filename in media]
+            post['local_media'] = paths if kind == 'gallery' else paths[0]
+            post['is_gallery'] = kind == 'gallery'
+        post['comments'] = comments
+        return post, media
+
+
+def write_media(directory, media, video_bytes, stats):
+    for folder, filename in media:
+        path = os.path.join(directory, folder, filename)
+        if os.path.exists(path):
+            continue
+        data = video_bytes if folder == 'videos' else IMAGE_BYTES
+        with open(path, 'wb') as f:
+            f.write(data)
+        stats['media_files'] += 1
+        stats['media_bytes'] += len(data)
+
+
+def generate(out_dir, generator, layout='both', video_kb=DEFAULT_VIDEO_KB):
+    """Write the layouts ('archive', 'search-results' or 'both') to out_dir and return counts."""
+    stats = {'posts': generator.posts, 'terms': len(generator.terms), 'search_result_posts': 0,
+             'comments': 0, 'media_files': 0, 'media_bytes': 0}
+    video_bytes = bytes(random.Random(generator.seed).getrandbits(8) for _ in range(video_kb * 1024))
+    subreddit = generator.subreddit
+    os.makedirs(out_dir, exist_ok=True)
+
+    with open(os.path.join(out_dir, 'terms.txt'), 'w', encoding='utf-8') as f:
+        for term in sorted(generator.terms):
+            f.write(term + '\n')
+
+    if layout in ('archive', 'both'):
+        subreddit_dir = os.path.join(out_dir, 'r', subreddit)
+        for folder in ('images', 'videos'):
+            os.makedirs(os.path.join(subreddit_dir, folder), exist_ok=True)
+
+        def posts():
+            for number in range(generator.posts):
+                term = generator.terms[generator.primary[number]]
+                # Relative to the repository, like download_media.py writes them
+                post, media = generator.post(number, os.path.join('r', subreddit), term)
+                write_media(subreddit_dir, media, video_bytes, stats)
+                stats['comments'] += len(post['comments'])
+                yield post
+
+        write_json_list(os.path.join(subreddit_dir, 'archive.json'), posts())
+
+    if layout in ('search-results', 'both'):
+        results_dir = os.path.join(out_dir, 'search-results')
+        for term, numbers in zip(generator.terms, generator.term_posts):
+            safe_term = term.lower().replace(' ', '_')
+            media_dir = os.path.join(results_dir, 'media', subreddit, safe_term)
+            for folder in ('images', 'videos'):
+                os.makedirs(os.path.join(media_dir, folder), exist_ok=True)
+
+            def posts():
+                for number in numbers:
+                    post, media = generator.post(number, os.path.join('./search-results', 'media', subreddit, safe_term), term)
+                    write_media(media_dir, media, video_bytes, stats)
+                    if layout == 'search-results':
+                        stats['comments'] += len(post['comments'])
+                    yield post
+
+            stats['search_result_posts'] += write_json_list(os.path.join(results_dir, f"{subreddit}_{term}.txt"), posts())
+
+    return stats
+
+
+IMAGE_BYTES = png_bytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic subreddit archive and search results for testing and benchmarks')
+    parser.add_argument('-o', '--output', required=True, help='Output folder')
+    parser.add_argument('-n', '--posts', type=int, default=DEFAULT_POSTS, help=f'Number of posts (default: {DEFAULT_POSTS})')
+    parser.add_argument('-s', '--subreddit', default=DEFAULT_SUBREDDIT, help=f'Subreddit name (default: {DEFAULT_SUBREDDIT})')
+    parser.add_argument('--comments', type=float, default=DEFAULT_COMMENTS_MEDIAN,
+                        help=f'Median comments per post; counts are log-normal (default: {DEFAULT_COMMENTS_MEDIAN})')
+    parser.add_argument('--duplicate-rate', type=float, default=DEFAULT_DUPLICATE_RATE,
+                        help=f'Share of posts found by more than one search term (default: {DEFAULT_DUPLICATE_RATE})')
+    parser.add_argument('--media-rate', type=float, default=DEFAULT_MEDIA_RATE,
+                        help=f'Share of posts with images, galleries or videos (default: {DEFAULT_MEDIA_RATE})')
+    parser.add_argument('--terms', type=int, help=f'Number of search terms (default: one per {POSTS_PER_TERM} posts)')
+    parser.add_argument('--video-kb', type=int, default=DEFAULT_VIDEO_KB, help=f'Size of each dummy video (default: {DEFAULT_VIDEO_KB})')
+    parser.add_argument('--layout', choices=['both', 'archive', 'search-results'], default='both',
+                        help='Write the viewer archive, the search results or both (default: both)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    generator = Generator(args.posts, args.subreddit, args.comments, args.duplicate_rate, args.media_rate, args.terms, args.seed)
+    stats = generate(args.output, generator, args.layout, args.video_kb)
+    print(f"Generated r/{args.subreddit} in {args.output}: {stats['posts']} posts, {stats['comments']} comments, "
+          f"{stats['terms']} search terms, {stats['media_files']} media files in {time.time() - start_time:.2f} seconds")
+
+if __name__ == '__main__':
+    main()
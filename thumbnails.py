@@ -0,0 +1,174 @@
+import os
+import time
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from atomic_write import temp_path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Resized copies of archived images for the feed. Originals are often several MB
+# while the feed shows them at card width, so derivatives are generated at a few
+# fixed widths on first request and kept in a size-bounded cache on disk.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, '.thumbnails')
+THUMBNAIL_WIDTHS = (320, 640, 960)
+CACHE_LIMIT_BYTES = 10 * 1024 ** 3
+# When the cache is over its limit, evict least recently used files down to this fraction
+CACHE_LOW_WATER = 0.9
+WEBP_QUALITY = 80
+# Animated GIFs would lose their animation, so they are always served as-is
+RESIZABLE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def is_resizable(filename):
+    return Image is not None and filename.lower().endswith(RESIZABLE_EXTENSIONS)
+
+
+def thumbnail_path(subreddit, width, filename, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, subreddit, str(width), filename + '.webp')
+
+
+def generate_thumbnail(source_path, dest_path, width):
+    """Write a WebP copy of source_path at most width pixels wide. Returns its size in bytes."""
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = temp_path(dest_path)
+        img.save(tmp_path, 'WEBP', quality=WEBP_QUALITY, method=4)
+    os.replace(tmp_path, dest_path)
+    return os.path.getsize(dest_path)
+
+
+class ThumbnailCache:
+    """Thumbnails on disk with least-recently-used eviction once over limit_bytes.
+
+    A file's mtime is bumped on every hit and used as its last-use time.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, limit_bytes=CACHE_LIMIT_BYTES):
+        self.cache_dir = cache_dir
+        self.limit_bytes = limit_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        files = []
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def total_size(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            return self._size
+
+    def get(self, subreddit, width, source_path):
+        """Return the path of the cached thumbnail for source_path, generating it if needed."""
+        path = thumbnail_path(subreddit, width, os.path.basename(source_path), self.cache_dir)
+        try:
+            if os.path.getmtime(path) >= os.path.getmtime(source_path):
+                os.utime(path)
+                self.hits += 1
+                return path
+        except FileNotFoundError:
+            pass
+
+        self.misses += 1
+        size = generate_thumbnail(source_path, path, width)
+        self.add(size)
+        return path
+
+    def add(self, size):
+        total = self.total_size()
+        with self._lock:
+            self._size = total + size
+            over_limit = self._size > self.limit_bytes
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            files = sorted(self._scan())
+            total = sum(size for _, size, _ in files)
+            target = self.limit_bytes * CACHE_LOW_WATER
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._size = total
+
+
+def _pregenerate(job):
+    source_path, dest_path, width = job
+    try:
+        if os.path.exists(dest_path) and os.path.getmtime(dest_path) >= os.path.getmtime(source_path):
+            return 0
+        return generate_thumbnail(source_path, dest_path, width)
+    except Exception as e:
+        print(f"Failed to generate thumbnail for {source_path}: {e}")
+        return 0
+
+
+def pregenerate(subreddit_dir, widths=THUMBNAIL_WIDTHS, workers=None, cache_dir=CACHE_DIR):
+    """Generate every missing thumbnail for a subreddit with a process pool."""
+    subreddit = os.path.basename(os.path.normpath(subreddit_dir))
+    images_dir = os.path.join(subreddit_dir, 'images')
+    jobs = [
+        (os.path.join(images_dir, filename), thumbnail_path(subreddit, width, filename, cache_dir), width)
+        for filename in sorted(os.listdir(images_dir)) if is_resizable(filename)
+        for width in widths
+    ]
+
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for size in executor.map(_pregenerate, jobs, chunksize=64):
+            written += size
+    return len(jobs), written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-generate feed thumbnails for archived subreddits')
+    parser.add_argument('directories', nargs='+', help='Subreddit directories, e.g. ./r/Touhou')
+    parser.add_argument('-w', '--widths', type=int, nargs='+', default=list(THUMBNAIL_WIDTHS), help='Thumbnail widths to generate')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    if Image is None:
+        print("Pillow is not installed: pip install pillow")
+        exit(1)
+
+    for directory in args.directories:
+        start_time = time.time()
+        count, written = pregenerate(directory, args.widths, args.workers)
+        print(f"{directory}: checked {count} thumbnails, wrote {written / 1024 ** 2:.1f} MB in {time.time() - start_time:.2f} seconds")
+
+    # Bring the cache back under its limit if the batch pushed it over
+    cache = ThumbnailCache()
+    if cache.total_size() > cache.limit_bytes:
+        cache.evict()
+
+if __name__ == '__main__':
+    main()